@@ -28,6 +28,96 @@ __version__ = "0.1.0"
 # calling it supply the dataframe in memory to avoid needing a file 
 # intermediate.
 #
+# Dataframes stored as Parquet (`.parquet` or `.pq`) or as Feather / Arrow IPC 
+# (`.feather`, `.arrow`, or `.ipc`) can also be used if `pyarrow` is 
+# installed. Only the columns needed get read from those, and Feather / Arrow 
+# IPC files are memory-mapped.
+#
+# Pickled or text forms can also be compressed, indicated by adding `.gz`, 
+# `.bz2`, `.xz`, `.zst`, or `.zip` after the extension, such as `data.tsv.gz`.
+# They are decompressed as they stream in, without an intermediate file.
+#
+# For tab- or comma-separated text too large to read in as a dataframe, use 
+# the `--chunksize` option (or `chunksize` when calling the main function) to 
+# have only the columns needed read in chunks and counted as the file streams 
+# in. Adding the `--categorical` option (`categorical=True`) has those columns 
+# parsed straight to categoricals, which cuts memory use further.
+#
+# If the data has already been summarized as a long-form table of counts, with
+# a row for each combination and a column of counts, use the `--counts_col` 
+# option (`counts_col`) to name that column and the counts get used directly.
+# Similarly, if each row carries a weight or value to total, such as a count 
+# or a size in bytes, use `--weight_col` (`weight_col`) to name that column and
+# the ring sizes and labels become the sums of it rather than numbers of rows.
+#
+# For data that keeps growing, such as a new file each hour, the counts can be
+# kept in a state file with `--state_file` and each new file added to them 
+# with `--append`, so that only the new data gets read each time:
+# `python script.py hour_01.tsv ... --state_file counts_state.pkl --append`.
+#
+# Data sharded over several files, such as `part-*.tsv`, can be provided by 
+# listing the files or with a glob pattern. Each file gets counted in its own 
+# process, see the `--processes` option, and the counts are combined.
+# A single large uncompressed tab- or comma-separated file can be split into 
+# parts at line breaks instead, with each part counted in its own process, by
+# giving `--processes` more than 1. (Only do that if no values contain line 
+# breaks within quotes; it is off otherwise, and the file is read whole.)
+#
+# Data in a local SQLite database (`.db`, `.sqlite`, or `.sqlite3`) can be 
+# used by also providing a table or query with the `--sql_source` option 
+# (`sql_source`). The database then does the counting with `GROUP BY` so that
+# only the counts get read in.
+#
+# To use the script at the end of a shell pipeline, use `-` in place of the 
+# file name and indicate the form of the text with `--format tsv` or 
+# `--format csv`. Stdin is then streamed in chunks straight into the counts.
+#
+# When the same large data gets plotted repeatedly, for example to adjust the
+# colors, use `--cache_dir` to keep the counts in a directory. Reruns on the 
+# same unchanged file(s) with the same columns then skip reading the data. The
+# files are recognized by path, size, and modification time.
+#
+# When using the script as a module, the counting, the working out of what to
+# plot, and the drawing can also be done as separate steps with
+# `tally_subgroups_from_input()`, `compute_donut_spec()`, and 
+# `render_donut_spec()`. The `DonutSpec` from the middle step is small and can
+# be kept to draw the plot again without recounting. To draw it in a thread,
+# such as in a web server making several plots at once, use 
+# `render_donut_figure()` instead, which takes the sizes per call and returns
+# a standalone figure, not tied to pyplot, to save with its `savefig()`.
+# For an animation or flip-book, such as a frame per day, make a spec for 
+# each frame and use `render_donut_frames()` or `iter_donut_frames()`, which 
+# make the figure once and update the wedges and labels in place each frame.
+#
+# To plot the same data for many pairs of columns and/or many filters, use 
+# `donut_plots_in_batch()`, which reads the data once, shares the counting 
+# work among the plots, and saves the images from a pool of processes:
+# `donut_plots_in_batch([("status", "subtype"), ("region", "subtype")], 
+# filters={"2019": "year == 2019", "2020": "year == 2020"}, 
+# df_file="data.tsv")`.
+#
+# When there are many groups, most are too small to see and the labels pile 
+# up. Use `--top_n_groups` to keep only the largest, or `--min_share` to keep 
+# only those making up at least that fraction of the total, with the rest 
+# combined as 'Other'.
+#
+# For a quick look at a large dataframe, use `--sample` with a number of rows
+# to make the plot from a sample of that many rows. By default the first rows
+# are used, so only that much of the file gets read; add 
+# `--sample_method reservoir` for a random sample from throughout the file, 
+# which streams the whole file but holds only the sample. The percentages are
+# then estimates, shown with a margin of error, e.g. `A (40.0% ±2.1% [200])`.
+#
+# To compare the breakdown among, for example, regions or months, use 
+# `--facet_col` (`facet_col`) with the name of that column to get a grid with
+# a plot for each of its values, colored the same way throughout.
+#
+# With hundreds of wedges, drawing their labels is most of the time it takes
+# to save the plot, though most belong to slivers too thin to read. Use 
+# `--min_label_angle` with a number of degrees, such as `3`, to leave off the 
+# labels of wedges spanning less than that, and `--culled_legend_size` to 
+# list the largest of the groups left unlabeled in a legend instead.
+#
 #
 #
 #
@@ -146,13 +236,14 @@ save_plot_name_prefix = "donut_plot"
 
 import sys
 import os
+import io
+import threading
 try:
     from pathlib import Path
 except ImportError:
     from pathlib2 import Path
 import pandas as pd
 import matplotlib.pyplot as plt
-import seaborn as sns
 import numpy as np
 
 
@@ -176,69 +267,1401 @@ def generate_output_file_name(save_plot_name_prefix):
     return save_plot_name_prefix + ".png"
 
 
-def extract_dataframe(file_name):
+def determine_file_format(file_name, file_format=None):
+    '''
+    Takes a file name and returns the extension that indicates how the 
+    dataframe is stored, along with the kind of compression indicated by a 
+    final extension of `.gz`, `.bz2`, `.xz`, `.zst`, or `.zip`. The compression
+    is None if there isn't such a final extension. Case doesn't matter for the
+    extensions and the returned extension is lowercase.
+
+    Optionally, provide `file_format`, such as `tsv` or `csv.gz`, to use in 
+    place of the extensions of the file name, such as when the file name is 
+    `-` for stdin.
+
+    Specific example
+    =================
+    Calling function with
+        ("data.tsv.gz")
+    returns
+        (".tsv", "gzip")
+    '''
+    compression_by_extension = {".gz": "gzip", ".bz2": "bz2", ".xz": "xz", 
+                                ".zst": "zstd", ".zip": "zip"}
+    if file_format:
+        file_name = "data." + file_format.lstrip(".")
+    suffixes = [x.lower() for x in Path(file_name).suffixes]
+    compression = None
+    if suffixes and suffixes[-1] in compression_by_extension:
+        compression = compression_by_extension[suffixes.pop()]
+    extension = suffixes[-1] if suffixes else ""
+    return extension, compression
+
+
+def extract_dataframe(
+    file_name, columns=None, categorical=False, file_format=None):
     '''
     Takes a file name and using the extension determines how to extract the
     dataframe recorded in it. 
     Returns a pandas dataframe object.
 
-    Works with pickled, tab-separated text, and comma-seperated text.
+    Works with pickled, tab-separated text, comma-seperated text, Parquet, and
+    Feather / Arrow IPC.
     (haven't added json yet).
-    Specify, which with file ending in `.pkl`,`.tsv`, or `.csv`.
-    Case doesn't matter for the extension.
-    '''
-    extension = Path(file_name).suffix
-    if extension.lower() == ".pkl":
-        return pd.read_pickle(file_name)
-    elif extension.lower() == ".tsv":
-        return pd.read_csv(file_name, sep='\t')
-    elif extension.lower() == ".csv":
-        return pd.read_csv(file_name)
+    Specify, which with file ending in `.pkl`,`.tsv`, `.csv`, `.parquet` (or 
+    `.pq`), or `.feather` (or `.arrow` or `.ipc`).
+    Case doesn't matter for the extension. Parquet and Feather / Arrow IPC 
+    need `pyarrow` installed.
+    Pickled dataframes and tab-separated or comma-separated text can also be 
+    compressed, which is indicated by adding `.gz`, `.bz2`, `.xz`, `.zst`, or 
+    `.zip` after the extension, such as `data.tsv.gz`. Those get decompressed
+    as they are read and not to an intermediate file.
+
+    Optionally, provide a list of column names as `columns` to only read in 
+    those columns. Pickled dataframes are always read in full.
+
+    Optionally, set `categorical=True` to have the columns read in stored as
+    pandas categoricals, i.e., integer codes plus a small table of the 
+    distinct values, instead of a Python object for every row. Or provide a 
+    list of column names as `categorical` to only have those columns stored 
+    that way. For text that happens as it is parsed and for Parquet and 
+    Feather / Arrow IPC the columns are dictionary-encoded before conversion.
+
+    Optionally, provide `file_format`, such as `tsv`, to use in place of the 
+    extension. That is needed when the file name is `-`, which means reading 
+    from stdin; only pickled or text forms can be read from stdin.
+    '''
+    extension, compression = determine_file_format(file_name, file_format)
+    dtype = categorical_dtypes(categorical)
+    if file_name == "-":
+        file_name = stdin_source()
+    if extension == ".pkl":
+        df = pd.read_pickle(file_name, compression=compression)
+        if categorical is True:
+            df = df.astype(dict.fromkeys(
+                df.columns if columns is None else columns, "category"))
+        elif categorical:
+            df = df.astype(dtype)
+        return df
+    elif extension == ".tsv":
+        return restore_numeric_categories(pd.read_csv(file_name, sep='\t', 
+            usecols=columns, dtype=dtype, compression=compression))
+    elif extension == ".csv":
+        return restore_numeric_categories(pd.read_csv(file_name, 
+            usecols=columns, dtype=dtype, compression=compression))
+    elif extension in (".parquet", ".pq") and compression is None:
+        if categorical:
+            import pyarrow.parquet as pq
+            return dictionary_encode_arrow_table(pq.read_table(
+                file_name, columns=columns), categorical).to_pandas()
+        return pd.read_parquet(file_name, columns=columns)
+    elif extension in (".feather", ".arrow", ".ipc") and compression is None:
+        return read_arrow_table(
+            file_name, columns=columns, categorical=categorical).to_pandas()
     else:
         sys.stderr.write("\n**ERROR** Cannot determine how dataframe is stored "
             "in '{}'.\nChange the file name extension in the input file to be "
-            "`.pkl`, `.tsv`, or `.csv` to indicate\nif dataframe stored "
-            "pickled, stored as tab-separated text, or stored as\n"
-            "comma-separated text."
+            "`.pkl`, `.tsv`, `.csv`, `.parquet`, or `.feather` to indicate\nif "
+            "dataframe stored pickled, stored as tab-separated text, stored\n"
+            "as comma-separated text, stored as Parquet, or stored as Feather / "
+            "Arrow IPC. Only\npickled or text forms can be compressed, "
+            "indicated by ending in `.gz`, `.bz2`,\n`.xz`, `.zst`, or `.zip` "
+            "after the extension"
             ".\n**EXITING !!**.\n".format(file_name))
         sys.exit(1)
 
+
+def categorical_dtypes(categorical):
+    '''
+    Takes the `categorical` setting used when reading in dataframes, either 
+    True, False, or a list of column names, and returns the corresponding 
+    `dtype` to supply to pandas when parsing text.
+
+    Specific example
+    =================
+    Calling function with
+        (["status", "group"])
+    returns
+        {"status": "category", "group": "category"}
+    '''
+    if categorical is True:
+        return "category"
+    elif categorical:
+        return dict.fromkeys(categorical, "category")
+    return None
+
+
+def read_arrow_table(file_name, columns=None, categorical=False):
+    '''
+    Takes a file name of a Feather / Arrow IPC file and returns a pyarrow 
+    Table of the specified columns, or all columns if `columns` is None.
+
+    The file is memory-mapped and so only the columns asked for actually get 
+    read from disk, and only when used. Set `categorical=True`, or to a list 
+    of column names, to have the columns dictionary-encoded so that they 
+    convert to pandas categoricals.
+    '''
+    import pyarrow.feather as feather
+    table = feather.read_table(file_name, columns=columns, memory_map=True)
+    if categorical:
+        table = dictionary_encode_arrow_table(table, categorical)
+    return table
+
+
+def dictionary_encode_arrow_table(table, categorical=True):
+    '''
+    Takes a pyarrow Table and returns it with any columns that are not already
+    dictionary-encoded encoded that way, so that each column converts to a 
+    pandas categorical. Provide a list of column names as `categorical` to 
+    only encode those columns.
+    '''
+    import pyarrow as pa
+    for i, name in enumerate(table.column_names):
+        if categorical is not True and name not in categorical:
+            continue
+        if not pa.types.is_dictionary(table.column(i).type):
+            table = table.set_column(
+                i, name, table.column(i).dictionary_encode())
+    return table
+
+
+def restore_numeric_categories(df):
+    '''
+    Takes a dataframe parsed from text and for any categorical columns where 
+    all the categories can be numbers, casts the categories to numbers. 
+    Categories parsed from text are always strings, and this keeps them 
+    matching what would be read in without categoricals, such as when 
+    subgroups are integers and listed in `hilolist`. 
+
+    Returns the dataframe.
+    '''
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            try:
+                df[col] = df[col].cat.rename_categories(
+                    pd.to_numeric(df[col].cat.categories))
+            except (ValueError, TypeError):
+                pass
+    return df
+
+
+def restore_numeric_levels(counts):
+    '''
+    Takes counts indexed by (group, subgroup), or by more levels, counted 
+    from text with the values read as strings, such as a chunk at a time by
+    `tally_subgroups_in_chunks()`, and returns them with the values of each 
+    level cast to numbers if all of them can be numbers, the same as 
+    `restore_numeric_categories()` does for categories, and otherwise left 
+    as strings. Done once for all the counts rather than for each chunk read,
+    so that a value gets the same type throughout, as when the file is read 
+    whole.
+
+    Specific example
+    =================
+    With a file where the groups are `1` for the first chunk and then `1` or
+    `X`, calling function with counts indexed by
+        [("1", "yes"), ("1", "no"), ("X", "yes")]
+    returns them with that index unchanged, whereas calling it with counts 
+    indexed by
+        [("1", "yes"), ("2", "no")]
+    returns them indexed by
+        [(1, "yes"), (2, "no")]
+    '''
+    arrays = []
+    for i in range(counts.index.nlevels):
+        values = counts.index.get_level_values(i)
+        try:
+            values = pd.to_numeric(values)
+        except (ValueError, TypeError):
+            pass
+        arrays.append(values)
+    counts.index = pd.MultiIndex.from_arrays(arrays, names=counts.index.names)
+    if not counts.index.is_unique:
+        # such as `1` and `01`, which are the same number
+        counts = counts.groupby(level=list(range(counts.index.nlevels)), 
+            sort=False, dropna=False).sum()
+    return counts
+
+
+def stdin_source():
+    '''
+    Returns stdin in the form pandas can read data from, as bytes when 
+    possible so that compressed data can also be piped in.
+    '''
+    return getattr(sys.stdin, "buffer", sys.stdin)
+
+
+def read_dataframe_in_chunks(file_name, columns, chunksize, 
+    categorical=False, file_format=None, byte_range=None, text_columns=None):
+    '''
+    generator to yield the dataframe recorded in a file as a series of smaller
+    dataframes of up to `chunksize` rows, each with only the specified 
+    columns. 
+    Uses the extension to determine how to read the file, like 
+    `extract_dataframe()`. Tab-separated and comma-separated text are parsed a 
+    chunk at a time, decompressing as they stream in if compressed. Parquet is
+    read a batch of rows at a time, and Feather / Arrow IPC is memory-mapped 
+    with a batch of rows at a time converted. Pickled dataframes cannot be 
+    read in pieces and so are yielded in full.
+    Set `categorical=True`, or to a list of column names, to have the columns
+    in each chunk be pandas categoricals, see `extract_dataframe()`.
+    Optionally, provide `file_format`, such as `tsv`, to use in place of the 
+    extension, which is needed when the file name is `-` for stdin.
+    For uncompressed tab-separated or comma-separated text, provide 
+    `byte_range`, a (start, end) pair of byte offsets at the starts of lines,
+    to only read the rows in that part of the file, see 
+    `newline_aligned_byte_ranges()`; the column names still come from the 
+    header line.
+    For tab-separated or comma-separated text, provide a list of column names
+    as `text_columns` to have those read as strings, or categoricals of 
+    strings, in every chunk rather than having their type worked out for 
+    each chunk separately, which can differ among chunks; see 
+    `restore_numeric_levels()` for casting them to numbers once counted.
+    '''
+    extension, compression = determine_file_format(file_name, file_format)
+    dtype = categorical_dtypes(categorical)
+    if text_columns and extension in (".tsv", ".csv"):
+        text_dtype = dict.fromkeys(text_columns, object)
+        if dtype == "category":
+            dtype = dict.fromkeys(columns, dtype)
+        text_dtype.update(dtype or {})
+        dtype = text_dtype
+    if file_name == "-":
+        file_name = stdin_source()
+    if byte_range and extension in (".tsv", ".csv") and compression is None:
+        sep = '\t' if extension == ".tsv" else ','
+        names = pd.read_csv(file_name, sep=sep, nrows=0).columns.tolist()
+        with io.BufferedReader(FileByteRange(file_name, *byte_range)) as f:
+            for chunk in pd.read_csv(f, sep=sep, header=None, names=names, 
+                usecols=columns, dtype=dtype, chunksize=chunksize):
+                yield chunk if text_columns else restore_numeric_categories(
+                    chunk)
+    elif extension == ".tsv":
+        for chunk in pd.read_csv(file_name, sep='\t', usecols=columns, 
+            dtype=dtype, compression=compression, chunksize=chunksize):
+            yield chunk if text_columns else restore_numeric_categories(chunk)
+    elif extension == ".csv":
+        for chunk in pd.read_csv(file_name, usecols=columns, dtype=dtype, 
+            compression=compression, chunksize=chunksize):
+            yield chunk if text_columns else restore_numeric_categories(chunk)
+    elif extension in (".parquet", ".pq") and compression is None:
+        import pyarrow.parquet as pq
+        read_dictionary = None
+        if categorical:
+            read_dictionary = columns if categorical is True else categorical
+        for batch in pq.ParquetFile(
+            file_name, read_dictionary=read_dictionary).iter_batches(
+            batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif extension in (".feather", ".arrow", ".ipc") and compression is None:
+        for batch in read_arrow_table(file_name, columns=columns, 
+            categorical=categorical).to_batches(max_chunksize=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield extract_dataframe(file_name, columns=columns, 
+            categorical=categorical, file_format=file_format)
+
+
+def tally_subgroups(df, groups_col, subgroups_col, dropna=True):
+    '''
+    Takes a dataframe and the names of the column with the groups and the 
+    column with the subgroups and counts the rows for each combination of 
+    group and subgroup.
+
+    Returns a pandas Series of counts indexed by (group, subgroup), in order of
+    first appearance in the dataframe. Unless `dropna=False`, rows missing 
+    either the group or the subgroup are not counted, as with `groupby`.
+    Categorical columns get counted on their integer codes and only 
+    combinations actually observed are included; the resulting index uses the 
+    plain values, not categories.
+    '''
+    return uncategorize_tally(df.groupby([groups_col, subgroups_col], 
+        sort=False, observed=True, dropna=dropna).size())
+
+
+def tally_from_count_table(
+    df, groups_col, subgroups_col, counts_col, dropna=True):
+    '''
+    Takes a dataframe that is already a long-form table of counts, with a 
+    column of groups, a column of subgroups, and a column with the count for 
+    each combination, and returns those counts the same way 
+    `tally_subgroups()` does without counting any rows. 
+
+    If any combination of group and subgroup is listed more than once, the 
+    counts listed for it get summed. Unless `dropna=False`, combinations 
+    missing either the group or the subgroup are left out, as with `groupby`.
+    '''
+    counts = df.set_index([groups_col, subgroups_col])[counts_col]
+    if dropna:
+        counts = counts[counts.index.get_level_values(0).notna() & 
+            counts.index.get_level_values(1).notna()]
+    if not counts.index.is_unique:
+        counts = counts.groupby(level=[0, 1], sort=False, observed=True, 
+            dropna=dropna).sum()
+    counts.name = None
+    return uncategorize_tally(counts)
+
+
+def tally_facets(df, facet_col, groups_col, subgroups_col, dropna=True, 
+    counts_col=None):
+    '''
+    Takes a dataframe and the names of a column with facets, such as region 
+    or month, the column with the groups, and the column with the subgroups,
+    and counts the rows for each combination of facet, group, and subgroup 
+    in one `groupby`, like `tally_subgroups()` does for groups and subgroups.
+    If the dataframe is a long-form table of counts, provide the name of the
+    column with the counts as `counts_col` to have those summed instead.
+
+    Returns a pandas Series of counts indexed by (facet, group, subgroup), in
+    order of first appearance in the dataframe.
+    '''
+    grouped = df.groupby([facet_col, groups_col, subgroups_col], sort=False,
+        observed=True, dropna=dropna)
+    counts = grouped[counts_col].sum() if counts_col else grouped.size()
+    counts.name = None
+    return uncategorize_tally(counts)
+
+
+def uncategorize_tally(counts):
+    '''
+    Takes counts indexed by (group, subgroup), or by more levels, and, if any
+    level of the index is categorical, returns the counts with the index 
+    using the plain values instead. The few distinct values are more 
+    convenient that way once counted, such as for sorting numbers. Otherwise 
+    returns counts unchanged.
+    '''
+    if any(isinstance(level.dtype, pd.CategoricalDtype) 
+        for level in counts.index.levels):
+        counts.index = pd.MultiIndex.from_arrays([np.asarray(
+            counts.index.get_level_values(i)) for i in range(
+            counts.index.nlevels)], 
+            names=counts.index.names)
+    return counts
+
+
+def merge_tallies(tallies, dropna=True):
+    '''
+    Takes a list of tallies made with `tally_subgroups()` and sums the counts 
+    for each combination of group and subgroup.
+
+    Returns a pandas Series of counts indexed by (group, subgroup), keeping the
+    order of first appearance across the tallies as provided.
+    '''
+    if len(tallies) == 1:
+        return tallies[0]
+    return pd.concat(tallies).groupby(
+        level=[0, 1], sort=False, dropna=dropna).sum()
+
+
+def tally_subgroups_in_chunks(file_name, groups_col, subgroups_col, 
+    chunksize, dropna=True, categorical=False, counts_col=None, 
+    file_format=None, byte_range=None, restore_numbers=True):
+    '''
+    Takes a file name along with the names of the column with the groups and 
+    the column with the subgroups and counts the rows for each combination of 
+    group and subgroup without reading in the entire dataframe.
+
+    Only the two columns needed are read, and that is done `chunksize` rows at
+    a time (see `read_dataframe_in_chunks()`), with each chunk folded into the
+    running counts. And so peak memory depends on the number of distinct group
+    and subgroup combinations, not on the number of rows. Set 
+    `categorical=True` to have the two columns parsed straight to pandas 
+    categoricals so that each chunk gets counted on small integer codes.
+    If the file is instead a long-form table of counts, provide the name of 
+    the column with the counts as `counts_col` to have those summed, see 
+    `tally_from_count_table()`. Provide `file_format`, such as `tsv`, when the 
+    file name is `-` to read from stdin. Provide `byte_range` to only count 
+    the rows in that part of the file, see `read_dataframe_in_chunks()`.
+
+    For text, the groups and subgroups are read as strings in every chunk and
+    cast to numbers once all are counted, if all can be numbers (see 
+    `restore_numeric_levels()`), so each gets the same type throughout. Set 
+    `restore_numbers=False` to leave them as strings, for when these counts 
+    get merged with others first.
+
+    Returns a pandas Series of counts indexed by (group, subgroup), in order of
+    first appearance in the file.
+    '''
+    columns = [groups_col, subgroups_col]
+    if counts_col:
+        columns.append(counts_col)
+    if categorical:
+        categorical = [groups_col, subgroups_col]
+    counts = None
+    for chunk in read_dataframe_in_chunks(file_name, columns, chunksize, 
+        categorical=categorical, file_format=file_format, 
+        byte_range=byte_range, text_columns=[groups_col, subgroups_col]):
+        if counts_col:
+            chunk_counts = tally_from_count_table(
+                chunk, groups_col, subgroups_col, counts_col, dropna=dropna)
+        else:
+            chunk_counts = tally_subgroups(
+                chunk, groups_col, subgroups_col, dropna=dropna)
+        if counts is None:
+            counts = chunk_counts
+        else:
+            counts = merge_tallies([counts, chunk_counts], dropna=dropna)
+    if counts is None:
+        # no rows of data in file
+        counts = tally_subgroups(pd.DataFrame(
+            columns=[groups_col, subgroups_col]), groups_col, subgroups_col)
+    if restore_numbers and determine_file_format(
+        file_name, file_format)[0] in (".tsv", ".csv"):
+        counts = restore_numeric_levels(counts)
+    return counts
+
+
+def expand_file_names(df_file):
+    '''
+    Takes the name of a file, a glob pattern such as `part-*.tsv`, or a list 
+    of either of those, and returns a list of the file names. Glob patterns 
+    are expanded in sorted order.
+
+    Specific example
+    =================
+    Calling function with
+        ("part-*.tsv")
+    returns
+        ["part-0.tsv", "part-1.tsv", "part-2.tsv"]
+    when those are the files matching.
+    '''
+    import glob
+    if isinstance(df_file, (list, tuple)):
+        patterns = df_file
+    else:
+        patterns = [df_file]
+    file_names = []
+    for pattern in patterns:
+        if glob.has_magic(str(pattern)):
+            matching = sorted(glob.glob(str(pattern)))
+            if not matching:
+                sys.stderr.write("\n**ERROR** No files match '{}'.\n"
+                    "**EXITING !!**.\n".format(pattern))
+                sys.exit(1)
+            file_names.extend(matching)
+        else:
+            file_names.append(pattern)
+    return file_names
+
+
+def tally_subgroups_in_files(
+    file_names, groups_col, subgroups_col, processes=None, **kwargs):
+    '''
+    Takes a list of file names, such as shards of one large export, along with
+    the names of the column with the groups and the column with the subgroups 
+    and returns the counts for each combination of group and subgroup over all
+    the files, like `tally_subgroups()` would for the files combined.
+
+    Each file is counted in a separate process of a pool of `processes` 
+    processes, defaulting to one per core (but no more than the number of 
+    files), and then those counts are merged. Any other keyword arguments, 
+    such as `chunksize`, are used for reading each file, see 
+    `tally_subgroups_from_input()`.
+    '''
+    import functools
+    import multiprocessing
+    tally_file = functools.partial(tally_subgroups_from_input, groups_col, 
+        subgroups_col, processes=1, **kwargs)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(file_names))
+    if processes > 1:
+        pool = multiprocessing.Pool(processes)
+        try:
+            tallies = pool.map(tally_file, file_names)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tallies = [tally_file(file_name) for file_name in file_names]
+    counts = merge_tallies(tallies, dropna=kwargs.get("dropna", True))
+    if kwargs.get("sample"):
+        counts.attrs["sampled_rows"] = sum(
+            tally.attrs.get("sampled_rows", 0) for tally in tallies)
+    return counts
+
+
+byte_range_size = 64 * 1024 * 1024 # smallest part of a single text file to 
+# count in its own process, see `tally_subgroups_from_input()`
+
+
+def newline_aligned_byte_ranges(file_name, parts):
+    '''
+    Takes the name of a tab-separated or comma-separated text file and a 
+    number of parts and returns a list of (start, end) byte offsets splitting 
+    the rows after the header line into about that many ranges of about equal 
+    size, with each range starting at the start of a line and ending at the 
+    end of one.
+
+    (Assumes no values contain line breaks within quotes, since a range could
+    then start partway through a row.)
+    '''
+    size = os.path.getsize(file_name)
+    with open(file_name, "rb") as f:
+        f.readline()
+        boundaries = [f.tell()]
+        for i in range(1, parts):
+            position = boundaries[0] + (size - boundaries[0]) * i // parts
+            if position <= boundaries[-1]:
+                continue
+            f.seek(position - 1)
+            f.readline()
+            boundaries.append(min(f.tell(), size))
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries[:-1], 
+        boundaries[1:]) if start < end]
+
+
+class FileByteRange(io.RawIOBase):
+    '''
+    Read-only file object for the bytes of a file from offset `start` up to 
+    offset `end`, so that pandas can parse just that part of a file as if it
+    were a file of its own.
+    '''
+    def __init__(self, file_name, start, end):
+        self.f = open(file_name, "rb")
+        self.f.seek(start)
+        self.remaining = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.f.readinto(memoryview(b)[:min(len(b), self.remaining)])
+        self.remaining -= n
+        return n
+
+    def close(self):
+        self.f.close()
+        super(FileByteRange, self).close()
+
+
+def tally_subgroups_in_byte_ranges(file_name, groups_col, subgroups_col, 
+    processes=None, chunksize=None, dropna=True, categorical=False, 
+    counts_col=None, file_format=None):
+    '''
+    Takes the name of one large tab-separated or comma-separated text file 
+    along with the names of the column with the groups and the column with the
+    subgroups, and counts the rows for each combination of group and subgroup
+    using several processes.
+
+    The file is split into `processes` newline-aligned byte ranges, see 
+    `newline_aligned_byte_ranges()`, defaulting to one per core, and each 
+    range is read and counted in its own process of a pool, streaming just 
+    the needed columns `chunksize` rows at a time, see 
+    `tally_subgroups_in_chunks()`. The groups and subgroups are read as 
+    strings in every range, and the counts of the ranges are then merged, in 
+    the order of the ranges, and cast to numbers once, if all can be numbers 
+    (see `restore_numeric_levels()`), and so the result is the same as 
+    counting the file in one go. The other settings are used for reading each
+    range, see `tally_subgroups_in_chunks()`.
+    '''
+    import multiprocessing
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    byte_ranges = newline_aligned_byte_ranges(file_name, processes)
+    settings = [(file_name, groups_col, subgroups_col, chunksize or 100000, 
+        dropna, categorical, counts_col, file_format, byte_range, False) 
+        for byte_range in byte_ranges]
+    if len(settings) > 1:
+        pool = multiprocessing.Pool(min(processes, len(settings)))
+        try:
+            tallies = pool.starmap(tally_subgroups_in_chunks, settings)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        tallies = [tally_subgroups_in_chunks(*range_settings) 
+            for range_settings in settings]
+    if not tallies:
+        # no rows of data in file
+        return tally_subgroups_in_chunks(file_name, groups_col, 
+            subgroups_col, chunksize or 100000, dropna, categorical, 
+            counts_col, file_format)
+    return restore_numeric_levels(merge_tallies(tallies, dropna=dropna))
+
+
+def tally_subgroups_from_sqlite(db_file, sql_source, groups_col, 
+    subgroups_col, dropna=True, counts_col=None, sample=None, 
+    sample_method="first"):
+    '''
+    Takes the name of a local SQLite database file, a table name or a query 
+    (starting with `SELECT` or `WITH`) as `sql_source`, and the names of the 
+    column with the groups and the column with the subgroups, and has the 
+    database count each combination of group and subgroup with `GROUP BY`. 
+    And so only those counts, and never the rows, get transferred into Python.
+
+    Returns the counts the same way `tally_subgroups()` does. When a table 
+    name is provided, the combinations are in order of first appearance in the
+    table; for a query the order is up to the database. Unless `dropna=False`,
+    rows missing either the group or the subgroup are not counted. If the 
+    source is instead a long-form table of counts, provide the name of the 
+    column with the counts as `counts_col` to have those summed.
+
+    Optionally, provide a number of rows as `sample` to only count that many 
+    rows, either the first rows or, with `sample_method="reservoir"`, a random
+    sample of rows picked by the database. The number of rows sampled and 
+    counted is then noted as `attrs["sampled_rows"]` of the counts.
+    '''
+    import sqlite3
+    def quote(identifier):
+        return '"{}"'.format(identifier.replace('"', '""'))
+    g, s = quote(groups_col), quote(subgroups_col)
+    amount = "SUM({})".format(quote(counts_col)) if counts_col else "COUNT(*)"
+    if sql_source.strip().lower().startswith(("select", "with")):
+        source = "({}) AS donut_source".format(sql_source.strip().rstrip(";"))
+        order_by = ""
+    else:
+        source = quote(sql_source)
+        order_by = " ORDER BY MIN(rowid)"
+    if sample:
+        source = "(SELECT {}* FROM {}{} LIMIT {:d}) AS donut_sample".format(
+            "rowid AS donut_rowid, " if order_by else "", source, 
+            " ORDER BY random()" if sample_method == "reservoir" else "", 
+            sample)
+        order_by = " ORDER BY MIN(donut_rowid)" if order_by else ""
+    where = " WHERE {} IS NOT NULL AND {} IS NOT NULL".format(g, s
+        ) if dropna else ""
+    if sample:
+        # also count the rows sampled
+        amount += ", COUNT(*)"
+    query = "SELECT {0}, {1}, {2} FROM {3}{4} GROUP BY {0}, {1}{5}".format(
+        g, s, amount, source, where, order_by)
+    connection = sqlite3.connect(db_file)
+    try:
+        rows = connection.execute(query).fetchall()
+    finally:
+        connection.close()
+    counts = pd.Series([row[2] for row in rows], 
+        index=pd.MultiIndex.from_tuples([row[:2] for row in rows], 
+        names=[groups_col, subgroups_col]), 
+        dtype="int64" if not counts_col else None)
+    if sample:
+        counts.attrs["sampled_rows"] = sum(row[3] for row in rows)
+    return counts
+
+
+def file_fingerprints(file_names):
+    '''
+    Takes a list of file names and returns a list with the full path, size, 
+    and modification time of each file, which changes whenever the file 
+    changes.
+    '''
+    fingerprints = []
+    for file_name in file_names:
+        stat = os.stat(file_name)
+        fingerprints.append(
+            (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns))
+    return fingerprints
+
+
+def tally_cache_key(file_names, *settings):
+    '''
+    Takes a list of file names and any settings that affect the counts, such 
+    as the column names, and returns a key for the cached counts. The key is a
+    hash of the fingerprint of each file, see `file_fingerprints()`, along 
+    with the settings, and so it changes whenever any of the files change.
+    '''
+    import hashlib
+    return hashlib.sha1(repr((file_fingerprints(file_names), settings)).encode(
+        "utf-8")).hexdigest()
+
+
+def read_cached_tally(cache_dir, key):
+    '''
+    Takes the path of the cache directory and a key made by 
+    `tally_cache_key()`, and returns the cached counts, or None if there are 
+    no counts cached for that key. The modification time of the cached counts 
+    gets updated when they are used so that the least recently used counts 
+    get evicted first, see `evict_cached_tallies()`.
+    '''
+    cache_file = os.path.join(cache_dir, key + ".pkl")
+    try:
+        counts = pd.read_pickle(cache_file)
+        os.utime(cache_file)
+    except Exception:
+        return None
+    return counts
+
+
+def write_cached_tally(cache_dir, key, counts, cache_size=1024):
+    '''
+    Takes the path of the cache directory, a key made by `tally_cache_key()`,
+    and counts, and stores the counts in the cache directory for that key. 
+    Then the least recently used counts get evicted until the cache is no 
+    larger than `cache_size` megabytes.
+
+    The counts are written with `write_pickle_in_place()` so that a partly 
+    written file never gets read, even when several runs share the cache 
+    directory.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    write_pickle_in_place(counts, os.path.join(cache_dir, key + ".pkl"))
+    evict_cached_tallies(cache_dir, cache_size)
+
+
+def write_pickle_in_place(obj, file_name):
+    '''
+    Takes a Python object and a file name and pickles the object to that file
+    by writing a temporary file in the same directory and then moving it into
+    place, so that the file is always either the old one or the complete new
+    one, even if the writing gets interrupted.
+    '''
+    import tempfile
+    handle, temp_file = tempfile.mkstemp(
+        dir=os.path.dirname(os.path.abspath(file_name)), suffix=".tmp")
+    os.close(handle)
+    try:
+        pd.to_pickle(obj, temp_file)
+        os.replace(temp_file, file_name)
+    finally:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+
+
+def evict_cached_tallies(cache_dir, cache_size=1024):
+    '''
+    Takes the path of the cache directory and removes the least recently used
+    counts stored there until the cache is no larger than `cache_size` 
+    megabytes.
+    '''
+    cached = []
+    for entry in os.scandir(cache_dir):
+        if entry.is_file() and entry.name.endswith(".pkl"):
+            stat = entry.stat()
+            cached.append((stat.st_mtime_ns, stat.st_size, entry.path))
+    cached.sort()
+    total_size = sum(size for _, size, _ in cached)
+    limit = cache_size * 1024 * 1024
+    for _, size, path in cached:
+        if total_size <= limit:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            pass # another run may have already removed it
+        total_size -= size
+
+
+def update_count_state(state_file, counts, columns, append=False, 
+    sources=None):
+    '''
+    Takes the name of a file in which to keep counts between runs, counts 
+    made by `tally_subgroups_from_input()`, and the names of the columns 
+    they were made from, and returns the counts to plot.
+
+    If `append` is True and the state file exists, the counts are added to 
+    those kept in it and the combined counts are returned; that way only new
+    data needs to be read each time. Otherwise, the counts are returned as 
+    they are. Either way the state file then holds the returned counts.
+
+    Optionally, provide `sources`, the name(s) of the file(s) the counts were
+    made from. They get recorded in the state file so that adding the same 
+    unchanged file again is caught rather than counting it twice.
+    '''
+    sources = file_fingerprints([file_name for file_name in expand_file_names(
+        sources) if file_name != "-"]) if sources is not None else []
+    state = {"columns": list(columns), "counts": counts, "sources": []}
+    if append and os.path.exists(state_file):
+        state = pd.read_pickle(state_file)
+        if state["columns"] != list(columns):
+            sys.stderr.write("\n**ERROR** The counts kept in '{}' were made "
+                "from the columns '{}',\nnot '{}'. Use another state file or "
+                "leave off `--append` (`append`) to start over."
+                "\n**EXITING !!**.\n".format(state_file, 
+                "', '".join(str(x) for x in state["columns"] if x), 
+                "', '".join(str(x) for x in columns if x)))
+            sys.exit(1)
+        repeated = [source[0] for source in sources if source in set(
+            state["sources"])]
+        if repeated:
+            sys.stderr.write("\n**ERROR** The counts kept in '{}' already "
+                "include '{}'.\n**EXITING !!**.\n".format(
+                state_file, "', '".join(repeated)))
+            sys.exit(1)
+        # keep missing data as it is in the counts provided
+        counts = merge_tallies([state["counts"], counts], dropna=False)
+    write_pickle_in_place({"columns": list(columns), "counts": counts, 
+        "sources": state["sources"] + sources}, state_file)
+    return counts
+
+
+def sample_rows(file_name, columns, sample, sample_method="first", 
+    chunksize=None, file_format=None, text_columns=None):
+    '''
+    Takes the name of a dataframe file, the names of the columns needed, and 
+    a number of rows, `sample`, and returns a dataframe with a sample of that
+    many rows of the file, for a quick look at a large file.
+
+    With `sample_method="first"`, the first rows are used and reading stops 
+    once there are enough, and so the time it takes doesn't depend on the 
+    size of the file. With `sample_method="reservoir"`, the file is streamed 
+    in chunks of `chunksize` rows and a random sample of rows from throughout
+    the file is kept using reservoir sampling; that reads the whole file but 
+    never holds more than the sample and a chunk in memory. The random 
+    numbers come from their own generator, seeded the same each time, so the 
+    same file gives the same sample.
+
+    For text, provide a list of column names as `text_columns` to have those 
+    read as strings in every chunk and cast to numbers once the sample is 
+    made, if all of the values can be numbers, so that each value gets the 
+    same type throughout, see `read_dataframe_in_chunks()`.
+    '''
+    chunksize = chunksize or 100000
+    if sample_method == "first":
+        chunks = []
+        rows = 0
+        for chunk in read_dataframe_in_chunks(file_name, columns, 
+            min(chunksize, sample), file_format=file_format, 
+            text_columns=text_columns):
+            chunks.append(chunk.iloc[:sample - rows])
+            rows += len(chunks[-1])
+            if rows >= sample:
+                break
+        df = pd.concat(chunks, ignore_index=True) if chunks else (
+            pd.DataFrame(columns=columns))
+        return restore_numeric_columns(df, text_columns, file_name, 
+            file_format)
+    rng = np.random.default_rng(42)
+    reservoir = {col: np.empty(sample, dtype=object) for col in columns}
+    seen = 0
+    for chunk in read_dataframe_in_chunks(file_name, columns, chunksize, 
+        file_format=file_format, text_columns=text_columns):
+        fill = min(max(sample - seen, 0), len(chunk))
+        for col in columns:
+            reservoir[col][seen:seen + fill] = chunk[col].to_numpy()[:fill]
+        # each later row, counting from zero as row `i`, replaces a random row 
+        # of the reservoir with chance `sample / (i + 1)`
+        slots = rng.integers(0, np.arange(seen + fill, seen + len(chunk)) + 1)
+        rows = np.flatnonzero(slots < sample) + fill
+        slots = slots[slots < sample]
+        # when rows of a chunk land in the same slot, the last one stays
+        last = len(slots) - 1 - np.unique(slots[::-1], return_index=True)[1]
+        for col in columns:
+            reservoir[col][slots[last]] = chunk[col].to_numpy()[rows[last]]
+        seen += len(chunk)
+    df = pd.DataFrame({col: reservoir[col][:min(seen, sample)] 
+        for col in columns}, columns=columns).infer_objects()
+    return restore_numeric_columns(df, text_columns, file_name, file_format)
+
+
+def restore_numeric_columns(df, text_columns, file_name, file_format=None):
+    '''
+    Takes a dataframe read from `file_name` with the columns listed in 
+    `text_columns` read as strings, see `sample_rows()`, and returns it with 
+    each of those columns cast to numbers if all of its values can be 
+    numbers, the same as `restore_numeric_levels()` does for counts. Only 
+    tab-separated or comma-separated text gets read as strings, and so the 
+    columns from other kinds of files are left as they are.
+    '''
+    extension = determine_file_format(file_name, file_format)[0]
+    if not text_columns or extension not in (".tsv", ".csv"):
+        return df
+    for col in text_columns:
+        try:
+            df[col] = pd.to_numeric(df[col])
+        except (ValueError, TypeError):
+            pass
+    return df
+
+
+def tally_subgroups_from_input(groups_col, subgroups_col, df_file=None, 
+    df=None, dropna=True, chunksize=None, categorical=False, counts_col=None,
+    processes=None, sql_source=None, file_format=None, cache_dir=None, 
+    cache_size=1024, sample=None, sample_method="first"):
+    '''
+    Takes the names of the column with the groups and the column with the 
+    subgroups along with either a dataframe or the name of a file with the 
+    dataframe, and returns the counts for each combination of group and 
+    subgroup as a pandas Series indexed by (group, subgroup), in order of first
+    appearance. 
+
+    A provided dataframe takes precedence over a file. The file can also be a
+    glob pattern, such as `part-*.tsv`, or a list of files; those get counted 
+    in parallel in a pool of `processes` processes and the counts merged, see
+    `tally_subgroups_in_files()`. A single uncompressed tab-separated or 
+    comma-separated text file of at least two times `byte_range_size` bytes 
+    is instead split into parts that get counted in parallel, see 
+    `tally_subgroups_in_byte_ranges()`, but only if `processes` is set to 
+    more than 1, since the split is at any line break, even one within a 
+    quoted value; if reading the parts fails, the file is counted whole. 
+    When reading from a file, only the needed columns are read and the 
+    options for how to read them are:
+    - `chunksize`, to stream the file in chunks of that many rows, see 
+    `tally_subgroups_in_chunks()`.
+    - `categorical`, to have the columns parsed straight to pandas 
+    categoricals.
+    If the dataframe is instead a long-form table of counts, provide the name 
+    of the column with the counts as `counts_col` and the counts get used 
+    directly instead of counting rows, see `tally_from_count_table()`.
+
+    The file can also be a SQLite database, indicated by the extension `.db`,
+    `.sqlite`, or `.sqlite3`, with the table or query to use provided as 
+    `sql_source`. The counting is then done by the database, see 
+    `tally_subgroups_from_sqlite()`.
+
+    Use `-` as the file to read tab-separated or comma-separated text from 
+    stdin, along with `file_format` of `tsv` or `csv` (optionally ending in a
+    compression extension, like `tsv.gz`). That is always streamed in chunks,
+    with the groups and subgroups read as strings and cast to numbers once all
+    are counted, so the counts are the same as for the file read whole.
+    `file_format` can also be used to override the extension of files.
+
+    Provide the path of a directory as `cache_dir` to keep the counts made 
+    from files there, so that later runs on the same unchanged files with the
+    same settings skip reading the files. The least recently used counts get 
+    removed once the directory gets larger than `cache_size` megabytes.
+
+    For a quick look at a large dataframe, provide a number of rows as 
+    `sample` and the counts are made from a sample of that many rows. 
+    `sample_method` can be `first`, for the first rows, or `reservoir`, for a
+    random sample from throughout, see `sample_rows()`. With more than one 
+    file, each file is sampled. The number of rows actually sampled and 
+    counted, which can be fewer than `sample` or, with several files, more, 
+    is noted as `attrs["sampled_rows"]` of the counts.
+    '''
+    if df is None:
+        file_names = expand_file_names(df_file)
+        if cache_dir and "-" not in file_names:
+            key = tally_cache_key(file_names, groups_col, subgroups_col, 
+                counts_col, dropna, sql_source, file_format, sample, 
+                sample_method)
+            counts = read_cached_tally(cache_dir, key)
+            if counts is None:
+                counts = tally_subgroups_from_input(groups_col, subgroups_col,
+                    df_file=file_names, dropna=dropna, chunksize=chunksize, 
+                    categorical=categorical, counts_col=counts_col, 
+                    processes=processes, sql_source=sql_source, 
+                    file_format=file_format, sample=sample, 
+                    sample_method=sample_method)
+                write_cached_tally(cache_dir, key, counts, cache_size)
+            return counts
+        if len(file_names) > 1:
+            return tally_subgroups_in_files(file_names, groups_col, 
+                subgroups_col, processes=processes, dropna=dropna, 
+                chunksize=chunksize, categorical=categorical, 
+                counts_col=counts_col, sql_source=sql_source, 
+                file_format=file_format, sample=sample, 
+                sample_method=sample_method)
+        df_file = file_names[0]
+        extension, compression = determine_file_format(df_file, file_format)
+        if df_file == "-":
+            if extension not in (".tsv", ".csv"):
+                sys.stderr.write("\n**ERROR** To read from stdin, indicate "
+                    "the data is tab-separated or comma-separated\ntext with "
+                    "`--format tsv` or `--format csv` (`file_format`)."
+                    "\n**EXITING !!**.\n")
+                sys.exit(1)
+            # stream stdin into the counts, even if no chunk size specified
+            chunksize = chunksize or 100000
+        if extension in (".db", ".sqlite", ".sqlite3"):
+            if not sql_source:
+                sys.stderr.write("\n**ERROR** A table or query to use from the"
+                    " SQLite database '{}' needs to be\nprovided with "
+                    "`--sql_source` (`sql_source`)."
+                    "\n**EXITING !!**.\n".format(df_file))
+                sys.exit(1)
+            return tally_subgroups_from_sqlite(df_file, sql_source, 
+                groups_col, subgroups_col, dropna=dropna, 
+                counts_col=counts_col, sample=sample, 
+                sample_method=sample_method)
+        if (extension in (".tsv", ".csv") and compression is None and 
+            df_file != "-" and not sample and processes and processes > 1):
+            # split one large file into parts counted in parallel, only when 
+            # asked for, since a line break within quotes would get split, and
+            # only when each part would be at least `byte_range_size` bytes
+            parts = min(processes, os.path.getsize(df_file) // byte_range_size)
+            if parts > 1:
+                try:
+                    return tally_subgroups_in_byte_ranges(df_file, groups_col,
+                        subgroups_col, processes=parts, chunksize=chunksize, 
+                        dropna=dropna, categorical=categorical, 
+                        counts_col=counts_col, file_format=file_format)
+                except pd.errors.ParserError:
+                    sys.stderr.write("Note: '{}' could not be split into "
+                        "parts at line breaks, such as due to line breaks "
+                        "within quotes;\nit is being counted whole.\n".format(
+                        df_file))
+        columns = [groups_col, subgroups_col]
+        if counts_col:
+            columns.append(counts_col)
+        if sample:
+            df = sample_rows(df_file, columns, sample, sample_method, 
+                chunksize=chunksize, file_format=file_format, 
+                text_columns=[groups_col, subgroups_col])
+    elif sample:
+        df = df.head(sample) if sample_method == "first" else df.sample(
+            n=min(sample, len(df)), random_state=42).sort_index()
+    if df is None:
+        if chunksize:
+            return tally_subgroups_in_chunks(df_file, groups_col, 
+                subgroups_col, chunksize, dropna=dropna, 
+                categorical=categorical, counts_col=counts_col, 
+                file_format=file_format)
+        df = extract_dataframe(df_file, columns=columns, 
+            categorical=[groups_col, subgroups_col] if categorical else False,
+            file_format=file_format)
+    if counts_col:
+        counts = tally_from_count_table(
+            df, groups_col, subgroups_col, counts_col, dropna=dropna)
+    else:
+        counts = tally_subgroups(df, groups_col, subgroups_col, dropna=dropna)
+    if sample:
+        counts.attrs["sampled_rows"] = int(df[[groups_col, subgroups_col]
+            ].notna().all(axis=1).sum()) if dropna else len(df)
+    return counts
+
     
+def crosstab_subgroups(counts, sort_on_subgroup_name=False):
+    '''
+    Takes counts indexed by (group, subgroup), such as made by 
+    `tally_subgroups()`, and returns the data to plot from them, made with 
+    array operations over all the counts at once instead of looping over the 
+    groups:
+    - the names of the groups, in sorted order
+    - the total count for each of those groups
+    - the names of the subgroups, with those for each group in turn ordered by
+    count, largest first, like `value_counts()` would (ties stay in order of
+    first appearance). If `sort_on_subgroup_name` is True, the subgroups for 
+    each group are instead ordered by name.
+    - the counts matching those subgroup names
+    - a list of lists of the subgroup names for each group
+
+    The counts are the group by subgroup count matrix with only the 
+    combinations that occur kept, and so with many groups this doesn't need 
+    the memory a full matrix would.
+    '''
+    if len(counts) == 0:
+        return [], [], [], [], []
+    group_codes, group_uniques = pd.factorize(
+        counts.index.get_level_values(0), sort=True)
+    values = counts.to_numpy()
+    if sort_on_subgroup_name:
+        within_group_key = pd.factorize(
+            counts.index.get_level_values(1), sort=True)[0]
+    else:
+        within_group_key = -values
+    # `lexsort` is stable and sorts on the last key first
+    order = np.lexsort((within_group_key, group_codes))
+    sorted_codes = group_codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    subgroup_size = values[order]
+    group_size = np.add.reduceat(subgroup_size, starts).tolist()
+    group_names = group_uniques.take(sorted_codes[starts]).tolist()
+    subgroup_names = counts.index.get_level_values(1).take(order).tolist()
+    ends = np.r_[starts[1:], len(order)].tolist()
+    list_o_subgroup_names_l = [subgroup_names[start:end] for start, end in zip(
+        starts.tolist(), ends)]
+    return (group_names, group_size, subgroup_names, subgroup_size.tolist(), 
+        list_o_subgroup_names_l)
+
+
+def profile_values(values, weights=None, stop_after=None, chunk_size=65536):
+    '''
+    Takes values, such as a column of a dataframe or a level of the index of 
+    the counts, and in one pass through them returns the distinct values that
+    aren't missing, in order of first appearance, along with the number of 
+    missing values. If `weights` are provided, such as the counts, the total 
+    of the weights for the missing values is returned instead of the number.
+
+    The values are gone through in chunks of `chunk_size` with pandas, and so 
+    they never get converted into a Python object for each value. Optionally,
+    provide `stop_after` to stop as soon as more than that many distinct 
+    values have been seen, such as when only checking if the values are 
+    binary. The missing values are then only tallied for the part looked at.
+    '''
+    values = pd.Series(values).reset_index(drop=True)
+    if weights is not None:
+        weights = np.asarray(weights)
+    step = chunk_size if stop_after is not None else max(len(values), 1)
+    distinct = []
+    seen = set()
+    missing = 0
+    for start in range(0, len(values), step):
+        chunk = values.iloc[start:start + step]
+        isna = chunk.isna().to_numpy()
+        if weights is None:
+            missing += int(isna.sum())
+        else:
+            missing += weights[start:start + step][isna].sum()
+        for value in pd.unique(chunk[~isna]).tolist():
+            if value not in seen:
+                seen.add(value)
+                distinct.append(value)
+        if stop_after is not None and len(distinct) > stop_after:
+            break
+    return distinct, missing
+
+
+def fold_into_other(counts, top_n_groups=None, top_n_subgroups=None, 
+    min_group_share=None, min_subgroup_share=None, other_label="Other"):
+    '''
+    Takes counts indexed by (group, subgroup), such as made by 
+    `tally_subgroups()`, and returns them with the less common groups and/or
+    subgroups combined into one named `other_label` so that the number of 
+    wedges in the plot stays manageable no matter how many groups or 
+    subgroups there are. Groups and subgroups are ranked by their total count
+    and what gets combined is set by the following:
+    - `top_n_groups`, the number of the largest groups to keep
+    - `top_n_subgroups`, the number of the largest subgroups to keep
+    - `min_group_share`, the smallest fraction of the total count a group 
+    needs to be kept
+    - `min_subgroup_share`, the same for subgroups
+    The combined group and subgroup come after the others in the order of 
+    first appearance. If nothing is set, the counts are returned as is.
+    '''
+    total_count = counts.sum()
+    for level, top_n, min_share in ((0, top_n_groups, min_group_share), 
+        (1, top_n_subgroups, min_subgroup_share)):
+        if not (top_n or min_share):
+            continue
+        ranked = counts.groupby(level=level, sort=False).sum().sort_values(
+            ascending=False, kind="mergesort")
+        if top_n:
+            ranked = ranked.iloc[:top_n]
+        if min_share:
+            ranked = ranked[ranked >= min_share * total_count]
+        fold = ~counts.index.get_level_values(level).isin(ranked.index)
+        if not fold.any():
+            continue
+        folded = counts[fold]
+        labels = [folded.index.get_level_values(0), 
+            folded.index.get_level_values(1)]
+        labels[level] = np.full(len(folded), other_label, dtype=object)
+        folded = pd.Series(folded.to_numpy(), index=pd.MultiIndex.from_arrays(
+            labels, names=counts.index.names))
+        counts = pd.concat([counts[~fold], folded]).groupby(
+            level=[0, 1], sort=False).sum()
+    return counts
+
+    
+color_brewer_seq_names = ["Blues", "Reds","Greens","Oranges",
+                        "Purples"] #"Greys" looks bad because white is least
+list_of_other_good_sequences = ["teal", "fuchsia", "darkslateblue", "sage",
+                                "darkviolet",  "crimson", "darkgoldenrod",
+                                "dodgerblue", "maroon", "darkolivegreen",
+                                "darkturquoise", "royalblue", "chocolate"]
+palette_cache = {} # light end of the color ramp for each base color, kept in
+# order of use so the least recently used can be dropped first
+palette_cache_size = 4096
+palette_cache_lock = threading.Lock()
+
+
 def sequential_color_maps_generator():
     '''
-    generator to yield a never-ending supply of sequential color palettes/ 
+    generator to yield a never-ending supply of sequential color palettes/
     color maps.
-    However it will start with several of the ones like color brwwer defined 
+    However it will start with several of the ones like color brwwer defined
     sequential ones. See 'sequential'
     at https://ggplot2.tidyverse.org/reference/scale_brewer.html (Turns out
-    same ones already in matplotlib, see 
-    https://matplotlib.org/tutorials/colors/colormaps.html so can even use 
+    same ones already in matplotlib, see
+    https://matplotlib.org/tutorials/colors/colormaps.html so can even use
     without having to convert from seaborn `sns.color_palette` to colormaps,
     which I didn't know if it was even possible without moving to the custom
     ones)
-    Only after those are exhausted will it move on to some other ones that 
-    I judged as possibly good options and diverse and then after those are 
-    exhausted it will try to generate random ones. 
-    '''
-    color_brewer_seq_names = ["Blues", "Reds","Greens","Oranges",
-                            "Purples"] #"Greys" looks bad because white is least
-    list_of_other_good_sequences = ["teal", "fuchsia", "darkslateblue", "sage", 
-                                    "darkviolet",  "crimson", "darkgoldenrod", 
-                                    "dodgerblue", "maroon", "darkolivegreen",  
-                                    "darkturquoise", "royalblue", "chocolate"]
-    np.random.seed(42)
-    for col_name in color_brewer_seq_names:
-        yield plt.get_cmap(col_name) #`plt.get_cmap` use based on
-        # https://matplotlib.org/tutorials/colors/colormaps.html
-    for col_name in list_of_other_good_sequences:
-        try:
-            yield sns.light_palette(col_name, as_cmap=True)
-        except ValueError:
-            yield sns.light_palette(col_name, as_cmap=True,input="xkcd")
-    while True:
-        rgb = tuple((np.random.random(size=3) * 1)) # based on 
-        # https://stackoverflow.com/a/48793922/8508004
-        yield sns.light_palette(rgb, input="rgb", as_cmap=True)
+    Only after those are exhausted will it move on to some other ones that
+    I judged as possibly good options and diverse and then after those are
+    exhausted it will try to generate random ones.
+
+    Each color map is made by `sequential_color_map()`, which works out any
+    one in the sequence directly. The plots get their colors from
+    `sequential_palette_table()`, which works out the same colors for many
+    color maps at once; if this generator gets replaced, such as by assigning
+    another generator function to `sequential_color_maps_generator` in a
+    notebook, the color maps from the replacement get used instead.
+    '''
+    import itertools
+    for k in itertools.count():
+        yield sequential_color_map(k)
+
+default_color_maps_generator = sequential_color_maps_generator
+
+
+def palette_base_colors(indices):
+    '''
+    Takes positions in the sequence of color maps, see
+    `sequential_color_maps_generator()`, and returns for each one the name of
+    the matplotlib color map to use or the RGB color the color map builds up
+    to.
+
+    The random colors come from their own random number generator, seeded
+    the same each time, rather than from NumPy's global one, and all that are
+    needed get made in one step.
+    '''
+    from matplotlib.colors import to_rgb
+    indices = [int(k) for k in indices]
+    first_random = len(color_brewer_seq_names) + len(
+        list_of_other_good_sequences)
+    random_colors = np.random.RandomState(42).random_sample(
+        (max([first_random - 1] + indices) - first_random + 1, 3))
+    base_colors = []
+    for k in indices:
+        if k < len(color_brewer_seq_names):
+            base_colors.append(color_brewer_seq_names[k])
+        elif k < first_random:
+            col_name = list_of_other_good_sequences[
+                k - len(color_brewer_seq_names)]
+            try:
+                base_colors.append(to_rgb(col_name))
+            except ValueError:
+                base_colors.append(to_rgb("xkcd:" + col_name))
+        else:
+            base_colors.append(tuple(random_colors[k - first_random].tolist()))
+    return base_colors
+
+
+def light_palette_ends(base_colors):
+    '''
+    Takes an array of RGB colors, one per row, and returns an array with the
+    light color each sequential color ramp starts from to build up to those
+    colors, the same as seaborn's `light_palette()` uses. That is a light
+    gray with a hint of the hue of the color, worked out in the HUSL color
+    space; here it is done with NumPy for all the colors at once.
+    '''
+    rgb = np.atleast_2d(np.asarray(base_colors, dtype=float))
+    m = np.array([[3.2406, -1.5372, -0.4986], [-0.9689, 1.8758, 0.0415],
+        [0.0557, -0.2040, 1.0570]])
+    m_inv = np.array([[0.4124, 0.3576, 0.1805], [0.2126, 0.7152, 0.0722],
+        [0.0193, 0.1192, 0.9505]])
+    ref_u, ref_v = 0.19784, 0.46834
+
+    def max_chroma(lightness, hue):
+        hrad = np.radians(hue)
+        sin_h = np.sin(hrad)
+        cos_h = np.cos(hrad)
+        sub1 = np.power(lightness + 16, 3.0) / 1560896.0
+        sub2 = np.where(sub1 > 0.008856, sub1, lightness / 903.3)
+        result = np.full(np.shape(hue), np.inf)
+        for m1, m2, m3 in m.tolist():
+            top = (0.99915 * m1 + 1.05122 * m2 + 1.14460 * m3) * sub2
+            rbottom = 0.86330 * m3 - 0.17266 * m2
+            lbottom = 0.12949 * m3 - 0.38848 * m1
+            bottom = (rbottom * sin_h + lbottom * cos_h) * sub2
+            for t in (0.0, 1.0):
+                chroma = lightness * (top - 1.05122 * t) / (
+                    bottom + 0.17266 * sin_h * t)
+                result = np.where((chroma > 0.0) & (chroma < result),
+                    chroma, result)
+        return result
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # RGB to lightness, chroma, and hue
+        linear = np.where(rgb > 0.04045, np.power((rgb + 0.055) / 1.055, 2.4),
+            rgb / 12.92)
+        x, y, z = (linear @ m_inv.T).T
+        denominator = x + 15.0 * y + 3.0 * z
+        lightness = np.where(y > 0.008856, 116.0 * np.power(y, 1.0 / 3.0) -
+            16.0, 116.0 * (7.787 * y + 16.0 / 116.0) - 16.0)
+        black = (denominator == 0.0) | (lightness == 0.0)
+        u = np.where(black, 0.0, 13.0 * lightness * (
+            4.0 * x / denominator - ref_u))
+        v = np.where(black, 0.0, 13.0 * lightness * (
+            9.0 * y / denominator - ref_v))
+        lightness = np.where(black, 0.0, lightness)
+        chroma = np.power(np.power(u, 2) + np.power(v, 2), 1.0 / 2.0)
+        hue = np.degrees(np.arctan2(v, u))
+        hue = np.where(hue < 0.0, 360.0 + hue, hue)
+        saturation = np.where((lightness > 99.9999999) | (
+            lightness < 0.00000001), 0.0, chroma / max_chroma(
+            lightness, hue) * 100.0)
+
+        # light gray of that hue back to RGB
+        light, light_saturation = 95.0, 0.15 * saturation
+        chroma = max_chroma(np.full(np.shape(hue), light), hue
+            ) / 100.0 * light_saturation
+        hrad = np.radians(hue)
+        var_u = np.cos(hrad) * chroma / (13.0 * light) + ref_u
+        var_v = np.sin(hrad) * chroma / (13.0 * light) + ref_v
+        y = np.power((light + 16.0) / 116.0, 3.0)
+        x = 0.0 - (9.0 * y * var_u) / ((var_u - 4.0) * var_v - var_u * var_v)
+        z = (9.0 * y - (15.0 * var_v * y) - (var_v * x)) / (3.0 * var_v)
+        linear = np.stack([x, np.full(np.shape(x), y), z], axis=-1) @ m.T
+        light_rgb = np.where(linear <= 0.0031308, 12.92 * linear,
+            1.055 * np.power(linear, 1.0 / 2.4) - 0.055)
+    return np.clip(light_rgb, 0, 1)
+
+
+def light_palette_ramps(base_colors):
+    '''
+    Takes a list of RGB colors and returns an array with, for each, the light
+    color its color ramp starts from and then the color itself, see
+    `light_palette_ends()`.
+
+    The light colors are kept in a cache by base color, so colors used again,
+    such as when the same plot is made again, aren't worked out again. Those
+    not in the cache are all worked out in one step. The least recently used
+    ones are dropped when the cache holds more than `palette_cache_size`. The
+    cache is only used while holding `palette_cache_lock`, so colors can be 
+    worked out in several threads at once.
+    '''
+    ramps = np.empty((len(base_colors), 2, 3))
+    with palette_cache_lock:
+        missing = [rgb for rgb in f7(base_colors) if rgb not in palette_cache]
+        if missing:
+            palette_cache.update(zip(missing, light_palette_ends(missing)))
+        for idx, rgb in enumerate(base_colors):
+            light = palette_cache.pop(rgb)
+            palette_cache[rgb] = light # move to the end as most recently used
+            ramps[idx] = (light, rgb)
+        while len(palette_cache) > palette_cache_size:
+            del palette_cache[next(iter(palette_cache))]
+    return ramps
+
+
+def sequential_color_map(k):
+    '''
+    Takes a position in the sequence of color maps, see
+    `sequential_color_maps_generator()`, and returns the color map at that
+    position without making those before it.
+    '''
+    from matplotlib.colors import LinearSegmentedColormap
+    base_color = palette_base_colors([k])[0]
+    if isinstance(base_color, str):
+        return plt.get_cmap(base_color)
+    light, rgb = light_palette_ramps([base_color])[0]
+    return LinearSegmentedColormap.from_list("blend", [tuple(light.tolist()),
+        tuple(rgb.tolist())])
+
+
+def sequential_palette_table(indices, intensities):
+    '''
+    Takes positions in the sequence of color maps, see
+    `sequential_color_maps_generator()`, and the degrees along a color map to
+    get the color for, and returns an array of RGBA colors with a row for
+    each color map and a column for each degree.
+
+    The colors of the color ramps are worked out with NumPy all at once,
+    matching what each color map would give, rather than making a color map
+    for each. If `sequential_color_maps_generator` has been replaced, the
+    color maps from the replacement are used instead.
+    '''
+    indices = np.asarray(indices, dtype=int)
+    intensities = np.asarray(intensities, dtype=float)
+    table = np.empty((len(indices), len(intensities), 4))
+    if sequential_color_maps_generator is not default_color_maps_generator:
+        colormp = sequential_color_maps_generator()
+        color_maps = [next(colormp) for i in range(max(
+            [-1] + indices.tolist()) + 1)]
+        for row, k in enumerate(indices.tolist()):
+            table[row] = color_maps[k](intensities)
+        return table
+    base_colors = palette_base_colors(indices)
+    ramp_rows = [row for row, base_color in enumerate(
+        base_colors) if not isinstance(base_color, str)]
+    for row, base_color in enumerate(base_colors):
+        if isinstance(base_color, str):
+            table[row] = plt.get_cmap(base_color)(intensities)
+    # look up the entries of a 256 color ramp the same way a color map would
+    lut_size = 256
+    lut_positions = np.linspace(0, 1, lut_size)[np.clip(
+        (intensities * lut_size).astype(int), 0, lut_size - 1)]
+    ramps = light_palette_ramps([base_colors[row] for row in ramp_rows])
+    light, rgb = ramps[:, 0, None, :], ramps[:, 1, None, :]
+    table[ramp_rows, :, :3] = np.clip(
+        lut_positions[None, :, None] * (rgb - light) + light, 0, 1)
+    table[ramp_rows, :, 3] = 1.0
+    return table
+
 
 def is_number(s):
     '''
@@ -307,6 +1730,637 @@ def f7(seq):
     return [x for x in seq if not (x in seen or seen_add(x))]
 
 
+def nth_permutation(seq, n):
+    '''
+    Takes a sequence and an integer, n, and returns the permutation of the 
+    sequence at index n in the order `itertools.permutations()` would give 
+    them, as a list.
+
+    The permutation is worked out directly using the factorial number system
+    rather than by going through the permutations before it, and so it takes
+    next to no time or memory even for sequences with many items.
+
+    Specific example
+    =================
+    `nth_permutation(["a", "b", "c"], 3)` returns `["b", "c", "a"]`, the same 
+    as `list(itertools.permutations(["a", "b", "c"]))[3]`.
+    '''
+    import math
+    pool = list(seq)
+    number_of_permutations = math.factorial(len(pool))
+    assert 0 <= n < number_of_permutations, ("There are only {} permutations "
+        "of {} items.".format(number_of_permutations, len(pool)))
+    permutation = []
+    for remaining in range(len(pool) - 1, -1, -1):
+        index, n = divmod(n, math.factorial(remaining))
+        permutation.append(pool.pop(index))
+    return permutation
+
+
+class DonutSpec(object):
+    '''
+    Compact, reusable description of the donut plot(s) made from counts by
+    `compute_donut_spec()`, holding everything `render_donut_spec()` needs to
+    draw them. The sizes and color settings are held as NumPy arrays and the
+    colors are held as indices into the sequence of color maps made by
+    `sequential_color_maps_generator()`, rather than as the color maps
+    themselves, so that a spec is small and can be pickled, for example to
+    compute it in another process and draw it elsewhere.
+
+    It has the following attributes:
+    - `total_count`, the total of all the counts
+    - `group_names`, `group_size`, `group_labels`, and `group_color_index` for
+    the outer ring, with a wedge for each group
+    - `subgroup_names`, `subgroup_size`, `subgroup_group_index` (the index of
+    the group each belongs to), and `subgroup_state_index` (the position of 
+    each in `states_represented`) for the inner ring, with a wedge for each
+    subgroup of each group
+    - `total_state_names`, `total_state_size`, `total_state_labels`, and
+    `total_state_color_index` for the ring totaling each state (subgroup),
+    drawn as its own plot to the left if `include_total_ring` is True
+    - `states_represented`, the states (subgroups) ordered from most intense
+    to least intense coloring, and `state_intensity`, the degree along the
+    color map of a group used for each of those states
+    - `ring_layout`, the radius and width of the outer ring and then the
+    radius and width of the inner ring
+    - `min_label_angle`, the number of degrees a wedge needs to span for its
+    label to be drawn, and `culled_legend_size`, the number of the labels 
+    left off to list in a legend instead (see `label_wedges()`)
+    '''
+    __slots__ = ("total_count", "group_names", "group_size", "group_labels",
+        "group_color_index", "subgroup_names", "subgroup_size",
+        "subgroup_group_index", "subgroup_state_index", "total_state_names",
+        "total_state_size", "total_state_labels", "total_state_color_index",
+        "states_represented", "state_intensity", "ring_layout", 
+        "include_total_ring", "min_label_angle", "culled_legend_size")
+
+    def __init__(self, **kwargs):
+        for attribute in self.__slots__:
+            setattr(self, attribute, kwargs.get(attribute))
+
+    def __repr__(self):
+        return "<DonutSpec of {} groups and {} subgroup wedges>".format(
+            len(self.group_names), len(self.subgroup_names))
+
+
+def compute_donut_spec(counts, hilolist=None, sort_on_subgroup_name=False,
+    include_percent_in_grp_label=True, include_total_in_grp_label=True,
+    light_color_for_last=True, advance_color_increments=0,
+    advance_right_color_increments=0, advance_left_permute_increments=0,
+    swap_left_colors=False, include_total_ring=False,
+    ring_layout=(1.3, 0.3, 1.3-0.3, 0.4), sample_size=None, group_order=None,
+    min_label_angle=None, culled_legend_size=0):
+    '''
+    Takes counts indexed by (group, subgroup), such as made by
+    `tally_subgroups_from_input()`, along with the settings for the plot, and
+    returns a `DonutSpec` with everything needed to draw the plot with
+    `render_donut_spec()`. Nothing is drawn here.
+
+    The color settings follow the main functions of the scripts:
+    - `hilolist`, the high to low intensity order for the subgroups; the order
+    of first appearance is used if not provided
+    - `light_color_for_last`, whether the last subgroup in that order gets the
+    lightest color
+    - `advance_color_increments`, how many color maps to skip first
+    - for when `include_total_ring` is True, `advance_right_color_increments`,
+    how many color maps to skip after those for the ring totaling the states,
+    along with `advance_left_permute_increments` and `swap_left_colors`, to
+    permute or reverse the colors of the states in that ring.
+    - `group_order`, all the groups in the order used to assign their color 
+    maps, for when the counts are one of several plots, such as facets, that
+    need the same colors for the same groups; otherwise the groups present 
+    are assigned color maps in order. (Likewise, providing all the states as
+    `hilolist` keeps the colors of the states the same among such plots.)
+
+    If the counts come from a sample of the data, provide the number of rows 
+    sampled as `sample_size` and the percentages in the labels are shown as 
+    estimates with a margin of error, the half-width of a 95% confidence 
+    interval for a proportion.
+
+    Optionally, provide `min_label_angle`, a number of degrees, to leave off
+    the labels of the wedges too thin to read, spanning less than that, and 
+    `culled_legend_size`, how many of the labels left off the groups (and 
+    the states) to list in a legend instead, see `label_wedges()`.
+    '''
+    total_count = counts.sum()
+    tc = counts.groupby(level=1, sort=False).sum().sort_values(
+        ascending=False, kind="mergesort")
+    if hilolist:
+        tc = tc.reindex([state for state in hilolist if state in tc.index])
+    (group_names, group_size, subgroup_names, subgroup_size,
+        list_o_subgroup_names_l) = crosstab_subgroups(counts,
+        sort_on_subgroup_name=sort_on_subgroup_name)
+
+    # Make the labels
+    def share(y):
+        p = y/total_count
+        if sample_size:
+            return "{:.1%} \u00b1{:.1%}".format(
+                p, 1.96 * np.sqrt(p * (1 - p) / sample_size))
+        return "{:.1%}".format(p)
+    ip_it_grp_label = {
+        (True,True):["{} ({} [{}])".format(
+            x,share(y),y) for x, y in zip(group_names, group_size)],
+        (True,False):["{} ({})".format(
+            x,share(y)) for x, y in zip(group_names, group_size)],
+        (False,True):["{} [{}]".format(
+            x,y) for x, y in zip(group_names, group_size)],
+        (False,False):["{}".format(
+            x) for x, y in zip(group_names, group_size)]}
+    total_state_names = tc.index.tolist()
+    total_state_size = tc.tolist()
+    total_state_labels = ["{} ({} [{}])".format(x, share(y), y
+        ) for x, y in zip(total_state_names, total_state_size)]
+
+    # Assign the color maps by their position in the sequence of color maps,
+    # with those for the ring totaling the states coming before those for
+    # the groups
+    color_index = advance_color_increments
+    total_state_color_index = []
+    if include_total_ring:
+        # assign them among all the states, in case some states are absent
+        all_states = hilolist or total_state_names
+        state_color_index = list(range(
+            color_index, color_index + len(all_states)))
+        color_index += len(all_states) + advance_right_color_increments
+        if advance_left_permute_increments:
+            state_color_index = nth_permutation(
+                state_color_index, advance_left_permute_increments-1)
+        if swap_left_colors:
+            state_color_index.reverse()
+        total_state_color_index = [state_color_index[idx] for idx in 
+            pd.Index(all_states).get_indexer(total_state_names).tolist()]
+    if group_order is None:
+        group_color_index = np.arange(
+            color_index, color_index + len(group_names))
+    else:
+        group_color_index = color_index + pd.Index(group_order).get_indexer(
+            group_names)
+
+    # assign intensity degree settings for each subgroup so consistent among
+    # other groups
+    states_represented = hilolist or profile_values(
+        counts.index.get_level_values(1))[0]
+    int_degree = np.linspace(0.6, 0.2, num=len(states_represented))
+    if not light_color_for_last:
+        int_degree = int_degree[::-1]
+    # look up the position of each subgroup among the states all at once 
+    # rather than searching the list of states for each one
+    subgroup_state_index = pd.Index(states_represented).get_indexer(
+        subgroup_names)
+    assert (subgroup_state_index >= 0).all(), ("The list specifying the "
+        "intensity degree is missing subgroups: '{}'.".format(f7(
+        [sgrp for sgrp, idx in zip(subgroup_names, subgroup_state_index.tolist(
+        )) if idx < 0])))
+    subgroup_group_index = np.repeat(np.arange(len(group_names)),
+        [len(subgroups_l) for subgroups_l in list_o_subgroup_names_l])
+
+    return DonutSpec(total_count=total_count, group_names=group_names,
+        group_size=np.asarray(group_size),
+        group_labels=ip_it_grp_label[(
+        include_percent_in_grp_label,include_total_in_grp_label)],
+        group_color_index=group_color_index, subgroup_names=subgroup_names,
+        subgroup_size=np.asarray(subgroup_size),
+        subgroup_group_index=subgroup_group_index,
+        subgroup_state_index=subgroup_state_index,
+        total_state_names=total_state_names,
+        total_state_size=np.asarray(total_state_size),
+        total_state_labels=total_state_labels,
+        total_state_color_index=np.asarray(total_state_color_index, dtype=int),
+        states_represented=states_represented, state_intensity=int_degree,
+        ring_layout=tuple(ring_layout), include_total_ring=include_total_ring,
+        min_label_angle=min_label_angle, culled_legend_size=culled_legend_size)
+
+
+def donut_spec_colors(spec):
+    '''
+    Takes a `DonutSpec` made by `compute_donut_spec()` and returns arrays of 
+    the RGBA colors for the wedges of the ring totaling the states, of the 
+    outer ring with the groups, and of the inner ring with the subgroups.
+
+    All the colors needed are worked out from the color maps in one step with
+    `sequential_palette_table()`.
+    '''
+    # the first two columns are for the outer rings and the rest for the 
+    # states
+    color_table = sequential_palette_table(np.r_[spec.group_color_index, 
+        spec.total_state_color_index], np.r_[0.63, 0.6, spec.state_intensity])
+    group_color_table = color_table[:len(spec.group_color_index)]
+    # pick the color for every subgroup from the colors of the states for 
+    # each group in one step
+    sub_grp_colors = group_color_table[:, 2:][
+        spec.subgroup_group_index, spec.subgroup_state_index]
+    return (color_table[len(spec.group_color_index):, 1], 
+        group_color_table[:, 0], sub_grp_colors)
+
+
+def label_wedges(ax, wedges, labels, min_label_angle=None, 
+    labeldistance=1.1, text_size=14, legend_size=0):
+    '''
+    Takes the axes with a ring of a donut plot, the wedges drawn for that 
+    ring, and their labels, and adds the label of each wedge spanning at 
+    least `min_label_angle` degrees, laid out the way `pie()` lays them out.
+    The labels of thinner wedges, too thin to read, are never made, and so 
+    the time spent making and laying out text stays about the same however 
+    many wedges there are.
+
+    Optionally, provide `legend_size`, how many of the labels left off to 
+    list in a legend below the plot instead, in two columns of smaller text,
+    those of the largest wedges first, with the number of any others noted 
+    as a last entry. Any legend already on the axes is replaced.
+
+    Returns a list of the texts added.
+    '''
+    theta1 = np.array([wedge.theta1 for wedge in wedges], dtype=float)
+    theta2 = np.array([wedge.theta2 for wedge in wedges], dtype=float)
+    shown = theta2 - theta1 >= (min_label_angle or 0)
+    texts = []
+    for idx in np.flatnonzero(shown).tolist():
+        thetam = np.radians(0.5 * (theta1[idx] + theta2[idx]))
+        xt = labeldistance * wedges[idx].r * np.cos(thetam)
+        yt = labeldistance * wedges[idx].r * np.sin(thetam)
+        texts.append(ax.text(xt, yt, str(labels[idx]), clip_on=False, 
+            horizontalalignment='left' if xt > 0 else 'right', 
+            verticalalignment='center', fontsize=text_size))
+    if legend_size:
+        if ax.get_legend() is not None:
+            ax.get_legend().remove()
+        culled = np.flatnonzero(~shown)
+        culled = culled[np.argsort(theta1[culled] - theta2[culled], 
+            kind="mergesort")]
+        if len(culled):
+            handles = [wedges[idx] for idx in culled[:legend_size].tolist()]
+            legend_labels = [labels[idx] for idx in culled[
+                :legend_size].tolist()]
+            if len(culled) > legend_size:
+                from matplotlib.patches import Patch
+                handles.append(Patch(facecolor="none", edgecolor="none"))
+                legend_labels.append("and {} more".format(
+                    len(culled) - legend_size))
+            ax.legend(handles, legend_labels, loc="upper center", 
+                bbox_to_anchor=(0.5, 0), ncol=2, frameon=False, 
+                fontsize=0.8 * text_size)
+    return texts
+
+
+def render_donut_spec(spec, figure_size, text_size, titles=None,
+    title_size=20, title_y=None, fig=None, axes=None):
+    '''
+    Takes a `DonutSpec` made by `compute_donut_spec()` and draws the plot it
+    describes, using the figure size and the text size provided. If the spec
+    includes the ring totaling the states, that is drawn as a plot on the left
+    and the groups with their subgroups as a plot on the right.
+
+    Optionally, provide `titles`, a list with a title for each plot, along
+    with the size of their text and their vertical position, `title_y`.
+
+    The plot is drawn on a new pyplot figure, so that it shows in Jupyter,
+    unless a matplotlib `Figure` is provided as `fig` to draw on instead. 
+    Either way, the drawing is done through the figure and its axes, not 
+    through pyplot's current figure. To draw in place of a figure's own 
+    layout, such as in a grid of plots, provide the axes to draw on as 
+    `axes`, a list with one for each plot.
+
+    Returns the axes with the plot of the groups with their subgroups.
+
+    The colors are worked out here with `sequential_palette_table()`, so a 
+    spec can be drawn many times. If the spec has a `min_label_angle`, the 
+    labels of thinner wedges are left off, see `label_wedges()`.
+    '''
+    outer_radius, outer_width, inner_radius, inner_width = spec.ring_layout
+    total_state_colors, group_colors, sub_grp_colors = donut_spec_colors(spec)
+    titles = list(titles or [])
+    if axes is None:
+        if fig is None:
+            fig = plt.figure(figsize=figure_size)
+        #1 row 2 cols if there is the ring totaling the states
+        plots = 2 if spec.include_total_ring else 1
+        axes = [fig.add_subplot(1, plots, idx + 1) for idx in range(plots)]
+
+    if spec.include_total_ring:
+        ######first (and only) row, first col (LEFT subplot)
+        ax = axes[0]
+        ax.axis('equal')
+        ### Only ring; THIS WILL BE TOTAL DATA FOR EACH 'STATE' / 'SUBGROUP'
+        mypie, _ = ax.pie(
+            spec.total_state_size, radius=outer_radius,
+            labels=spec.total_state_labels, textprops={'fontsize': text_size},
+            colors=total_state_colors, 
+            labeldistance=None if spec.min_label_angle else 1.1)
+        plt.setp( mypie, width=outer_width, edgecolor='white')
+        if spec.min_label_angle:
+            label_wedges(ax, mypie, spec.total_state_labels, 
+                spec.min_label_angle, text_size=text_size, 
+                legend_size=spec.culled_legend_size)
+        ax.margins(0,0)
+        if titles:
+            ax.set_title(titles.pop(0), size = title_size, y=title_y)
+    #####first (and only) row, second col (RIGHT subplot) if two plots
+    ax = axes[-1]
+    ax.axis('equal')
+
+    ### First Ring (outside)
+    ### This will be the main groups
+    mypie, _ = ax.pie(
+        spec.group_size, radius=outer_radius, labels=spec.group_labels,
+        textprops={'fontsize': text_size}, colors=group_colors,
+        labeldistance=None if spec.min_label_angle else 1.1)
+    plt.setp( mypie, width=outer_width, edgecolor='white')
+    if spec.min_label_angle:
+        label_wedges(ax, mypie, spec.group_labels, spec.min_label_angle, 
+            text_size=text_size, legend_size=spec.culled_legend_size)
+
+    ### Second Ring (Inside)
+    ### This will be the subgroup counting for each group
+    mypie2, _ = ax.pie(
+        spec.subgroup_size, radius=inner_radius, labels=spec.subgroup_names,
+        textprops={'fontsize': text_size}, 
+        labeldistance=None if spec.min_label_angle else 0.7,
+        colors=sub_grp_colors)
+    plt.setp( mypie2, width=inner_width, edgecolor='white')
+    if spec.min_label_angle:
+        # the subgroups repeat among the groups, and so are left out of the 
+        # legend
+        label_wedges(ax, mypie2, spec.subgroup_names, spec.min_label_angle, 
+            labeldistance=0.7, text_size=text_size)
+    ax.margins(0,0)
+    if titles:
+        ax.set_title(titles.pop(0), size = title_size, y=title_y)
+    return ax
+
+
+def render_donut_figure(spec, figure_size=(7,8), text_size=14, titles=None,
+    title_size=20, title_y=None):
+    '''
+    Takes a `DonutSpec` made by `compute_donut_spec()` and returns a 
+    standalone matplotlib `Figure`, on its own Agg canvas, with the plot it 
+    describes, see `render_donut_spec()`. The figure size, the text sizes, 
+    and the titles are all taken per call rather than from the settings at the
+    top of the script.
+
+    Nothing goes through pyplot, which keeps track of figures for the whole 
+    process, and so plots can be made in several threads at once, such as for
+    a web server. Save the plot with the `savefig()` method of the figure, 
+    for example to an `io.BytesIO()` with `format="png"`; the figure is not 
+    kept anywhere and gets freed once no longer used.
+    '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=figure_size)
+    FigureCanvasAgg(fig)
+    render_donut_spec(spec, figure_size, text_size, titles=titles, 
+        title_size=title_size, title_y=title_y, fig=fig)
+    return fig
+
+
+def facet_donut_specs(facet_counts, counts, other_label="Other", 
+    **kwargs):
+    '''
+    Takes counts indexed by (facet, group, subgroup), such as made by 
+    `tally_facets()`, and the overall counts indexed by (group, subgroup) 
+    once any missing data is set aside and any smaller groups or subgroups 
+    are combined (see `fold_into_other()`), and returns a list of the facets,
+    sorted, such as by year or month, and a list with a `DonutSpec` for each
+    facet, made by `compute_donut_spec()` with any other keyword arguments.
+
+    Each facet gets the groups and subgroups of the overall counts, with any 
+    others combined as `other_label`. The color maps are assigned in the 
+    order of the groups and the states overall, and so a group or a state 
+    gets the same colors in every facet.
+    '''
+    levels = [facet_counts.index.get_level_values(i) for i in range(3)]
+    present = levels[0].notna() & levels[1].notna() & levels[2].notna()
+    levels = [level[present] for level in levels]
+    groups = counts.index.get_level_values(0)
+    states = profile_values(counts.index.get_level_values(1))[0]
+    facet_counts = pd.Series(facet_counts.to_numpy()[present], 
+        index=pd.MultiIndex.from_arrays([levels[0], 
+        levels[1].where(levels[1].isin(groups), other_label), 
+        levels[2].where(levels[2].isin(states), other_label)])).groupby(
+        level=[0, 1, 2], sort=False).sum()
+    kwargs["hilolist"] = kwargs.get("hilolist") or states
+    kwargs["group_order"] = profile_values(groups)[0]
+    facet_names = []
+    specs = []
+    for facet, counts_for_facet in facet_counts.groupby(level=0, sort=True):
+        facet_names.append(facet)
+        specs.append(compute_donut_spec(
+            counts_for_facet.droplevel(0), **kwargs))
+    return facet_names, specs
+
+
+facet_row_spacing = 0.6 # space between the rows of a grid of facets, as a 
+# fraction of the height of a plot, see `render_facet_grid()`
+
+
+def render_facet_grid(specs, facet_names, figure_size, text_size, 
+    titles=None, title_size=20, title_y=None, ncols=None):
+    '''
+    Takes a list of `DonutSpec`s, such as made by `facet_donut_specs()`, and
+    the facet of each, and draws them on one figure as a grid, `ncols` facets
+    across, defaulting to about as many across as down. Each facet gets an 
+    area of the size `figure_size`, and its name is added to the last of the
+    `titles` (see `render_donut_spec()`) or used as the title if there are 
+    none.
+
+    The rows are spaced `facet_row_spacing` apart, as a fraction of the 
+    height of a plot.
+
+    Returns a list with the axes with the plot of the groups with their 
+    subgroups for each facet.
+    '''
+    ncols = ncols or int(np.ceil(np.sqrt(len(specs))))
+    nrows = int(np.ceil(len(specs) / float(ncols)))
+    plots = 2 if specs and specs[0].include_total_ring else 1
+    fig = plt.figure(figsize=(figure_size[0] * ncols, figure_size[1] * nrows))
+    # leave room between the rows for the labels and any legend below each
+    # plot and the titles above
+    fig.subplots_adjust(hspace=facet_row_spacing)
+    group_axes = []
+    for idx, (spec, facet) in enumerate(zip(specs, facet_names)):
+        axes = [fig.add_subplot(nrows, ncols * plots, idx * plots + plot + 1) 
+            for plot in range(plots)]
+        facet_titles = list(titles or [""] * plots)
+        facet_titles[-1] = "{} ({})".format(facet_titles[-1], facet) if (
+            facet_titles[-1]) else "{}".format(facet)
+        group_axes.append(render_donut_spec(spec, figure_size, text_size, 
+            titles=facet_titles, title_size=title_size, title_y=title_y, 
+            axes=axes))
+    return group_axes
+
+
+def update_donut_ring(ax, wedges, texts, sizes, labels, colors, radius, 
+    width, text_size, labeldistance=1.1):
+    '''
+    Takes the axes with a ring of a donut plot, the lists of the wedges and 
+    of the label texts drawn for that ring, and the sizes, labels, and colors
+    for the ring, and updates the wedges and texts in place to show those, 
+    laid out the way `pie()` lays them out. 
+
+    If there are more sizes than wedges, wedges and texts are added to the 
+    axes and to the lists; any left over are hidden, so they can be used 
+    again for a later frame. If `texts` is None, only the wedges are updated,
+    for when the labels are added each frame by `label_wedges()`.
+    '''
+    from matplotlib.patches import Wedge
+    sizes = np.asarray(sizes, dtype=float)
+    while len(wedges) < len(sizes):
+        wedges.append(ax.add_patch(Wedge((0, 0), radius, 0, 0, width=width, 
+            edgecolor='white', clip_on=False)))
+        if texts is not None:
+            texts.append(ax.text(0, 0, "", clip_on=False, 
+                verticalalignment='center', fontsize=text_size))
+    # the start and end of each wedge as fractions of the circle
+    theta = np.r_[0, np.cumsum(sizes / sizes.sum())] if sizes.sum() else (
+        np.zeros(len(sizes) + 1))
+    for idx, wedge in enumerate(wedges):
+        text = texts[idx] if texts is not None else None
+        if idx >= len(sizes):
+            wedge.set_visible(False)
+            if text is not None:
+                text.set_visible(False)
+            continue
+        wedge.set(theta1=360. * theta[idx], theta2=360. * theta[idx + 1], 
+            facecolor=colors[idx], visible=True)
+        if text is None:
+            continue
+        thetam = np.pi * (theta[idx] + theta[idx + 1])
+        xt = labeldistance * radius * np.cos(thetam)
+        yt = labeldistance * radius * np.sin(thetam)
+        text.set(position=(xt, yt), text=str(labels[idx]), visible=True, 
+            horizontalalignment='left' if xt > 0 else 'right')
+
+
+def iter_donut_frames(specs, figure_size=(7,8), text_size=14, titles=None,
+    title_size=20, title_y=None, frame_titles=None):
+    '''
+    generator to draw a sequence of `DonutSpec`s, such as one per day, as the
+    frames of an animation or flip-book, yielding the figure once each frame
+    is drawn, for saving it or grabbing it for a movie.
+
+    The figure is made once, by `render_donut_figure()` for the first spec, 
+    and for each later frame the wedge angles and colors and the label text 
+    are updated in place with `update_donut_ring()` rather than drawn anew.
+    The same figure is yielded each time, and so save or grab it before 
+    getting the next frame, e.g.:
+        for idx, fig in enumerate(iter_donut_frames(specs)):
+            fig.savefig("day_{:03d}.png".format(idx))
+    or, with a matplotlib animation writer:
+        frames = iter_donut_frames(specs)
+        fig = next(frames)
+        with writer.saving(fig, "donuts.mp4", dpi=100):
+            writer.grab_frame()
+            for fig in frames:
+                writer.grab_frame()
+
+    Optionally, provide `titles` to use for every frame, or `frame_titles`,
+    the titles for each frame. All the specs need to have the same 
+    `ring_layout` and all or none of them the ring totaling the states. If 
+    the first spec has a `min_label_angle`, the labels are instead made anew 
+    each frame for only the wedges wide enough for them, see 
+    `label_wedges()`.
+    '''
+    frame_titles = iter(frame_titles) if frame_titles is not None else None
+    fig = None
+    for spec in specs:
+        if frame_titles is not None:
+            titles = next(frame_titles)
+        if fig is None:
+            fig = render_donut_figure(spec, figure_size=figure_size, 
+                text_size=text_size, titles=titles, title_size=title_size, 
+                title_y=title_y)
+            # collect the wedges and texts of each ring, with the outer ring
+            # drawn before the inner one
+            outer_radius, outer_width, inner_radius, inner_width = (
+                spec.ring_layout)
+            ax = fig.axes[-1]
+            wedges, texts = list(ax.patches), list(ax.texts)
+            n = len(spec.group_size)
+            rings = [(ax, wedges[:n], texts[:n], outer_radius, outer_width, 
+                1.1), (ax, wedges[n:], texts[n:], inner_radius, inner_width, 
+                0.7)]
+            if spec.include_total_ring:
+                rings.insert(0, (fig.axes[0], list(fig.axes[0].patches), 
+                    list(fig.axes[0].texts), outer_radius, outer_width, 1.1))
+            labels_made_each_frame = bool(spec.min_label_angle)
+            if labels_made_each_frame:
+                rings = [ring[:2] + (None,) + ring[3:] for ring in rings]
+            yield fig
+            continue
+        total_state_colors, group_colors, sub_grp_colors = donut_spec_colors(
+            spec)
+        ring_contents = [(spec.group_size, spec.group_labels, group_colors), 
+            (spec.subgroup_size, spec.subgroup_names, sub_grp_colors)]
+        if spec.include_total_ring:
+            ring_contents.insert(0, (spec.total_state_size, 
+                spec.total_state_labels, total_state_colors))
+        if labels_made_each_frame:
+            for ring_ax in fig.axes:
+                for text in list(ring_ax.texts):
+                    text.remove()
+        for ring, ((ring_ax, wedges, texts, radius, width, distance), (
+            sizes, labels, colors)) in enumerate(zip(rings, ring_contents)):
+            update_donut_ring(ring_ax, wedges, texts, sizes, labels, colors,
+                radius, width, text_size, labeldistance=distance)
+            if labels_made_each_frame:
+                # no legend for the inner ring with the subgroups, the last
+                label_wedges(ring_ax, wedges[:len(sizes)], labels, 
+                    spec.min_label_angle, labeldistance=distance, 
+                    text_size=text_size, legend_size=0 if ring == len(
+                    rings) - 1 else spec.culled_legend_size)
+        for title_ax, title in zip(fig.axes, titles or []):
+            title_ax.set_title(title, size=title_size, y=title_y)
+        yield fig
+
+
+def render_donut_frames(specs, frame_file_pattern="donut_frame_{:04d}.png",
+    figure_size=(7,8), text_size=14, titles=None, title_size=20, 
+    title_y=None, frame_titles=None):
+    '''
+    Takes a sequence of `DonutSpec`s, such as one per day, and saves each as 
+    a frame image, with the file name made by formatting 
+    `frame_file_pattern` with the number of the frame, counting from zero.
+    The figure is made once and updated in place for each frame, see 
+    `iter_donut_frames()` for that and the other settings.
+
+    Returns a list of the names of the files saved.
+    '''
+    file_names = []
+    for idx, fig in enumerate(iter_donut_frames(specs, 
+        figure_size=figure_size, text_size=text_size, titles=titles, 
+        title_size=title_size, title_y=title_y, frame_titles=frame_titles)):
+        file_names.append(frame_file_pattern.format(idx))
+        fig.savefig(file_names[-1])
+    return file_names
+
+
+def warm_up_renderer():
+    '''
+    Draws a small figure with text on an Agg canvas and throws it away, so 
+    that matplotlib and its fonts are loaded and ready before the first plot,
+    such as when starting the processes of a pool for drawing plots.
+    '''
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure(figsize=(1, 1))
+    fig.text(0.5, 0.5, "warm up")
+    FigureCanvasAgg(fig).draw()
+
+
+def save_donut_figure(spec, file_name, figure_size, text_size, titles=None,
+    title_size=20, title_y=None):
+    '''
+    Takes a `DonutSpec` made by `compute_donut_spec()`, the name of a file, 
+    and the settings for `render_donut_figure()`, and saves the plot to that 
+    file. Returns the file name. 
+    Meant to be run in the processes of a pool, see `donut_plots_in_batch()`.
+    '''
+    render_donut_figure(spec, figure_size=figure_size, text_size=text_size, 
+        titles=titles, title_size=title_size, title_y=title_y).savefig(
+        file_name)
+    return file_name
+
+
 ###--------------------------END OF HELPER FUNCTIONS--------------------------###
 ###--------------------------END OF HELPER FUNCTIONS--------------------------###
 
@@ -320,10 +2374,17 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
     advance_color_increments=0, advance_right_color_increments=0,
     include_subplot_titles=include_subplot_titles,
     total_plot_title = total_plot_title, 
-    group_plot_title = group_plot_title):
+    group_plot_title = group_plot_title, chunksize=None, categorical=False,
+    counts_col=None, processes=None,
+    sql_source=None, file_format=None, cache_dir=None, cache_size=1024,
+    weight_col=None, state_file=None, append=False, top_n_groups=None, 
+    min_share=None, sample=None, 
+    sample_method="first", facet_col=None, min_label_angle=None, 
+    culled_legend_size=0):
     '''
     Takes the following:
-    - name of a dataframe file (string) or a dataframe
+    - name of a dataframe file (string) or a dataframe. A list of files, 
+    or a glob pattern matching them, can be provided in place of one file.
     - text of name of column to use as binary data
     - text of name of column to use in grouping
     - Whether you want an image saved or not. If no image file saved, it tries
@@ -346,6 +2407,59 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
     than  default; it is disregarded if `include_subplot_titles=False`.
     - optionally, whether you want to set group plot title to anything other 
     than default; it is disregarded if `include_subplot_titles=False`.
+    - optionally, a number of rows to read at a time from a tab-separated or 
+    comma-separated text file so that the groups and binary states get counted 
+    as the file is streamed in, without ever having the entire dataframe in 
+    memory. Only the binary state and grouping columns are read. Disregarded 
+    if a dataframe is provided.
+    - optionally, whether to have the binary state and grouping columns parsed
+    straight to pandas categoricals when read from a file, so that they are 
+    held and counted as small integer codes rather than a Python string for 
+    each row. Disregarded if a dataframe is provided.
+    - optionally, the name of a column with counts if the dataframe is a 
+    long-form table of counts, i.e., one row per group and binary state 
+    combination listing the number for that combination. The counts are then
+    used directly instead of counting rows.
+    - optionally, the name of a column with a weight or value for each row, 
+    such as a count or a size in bytes, to total instead of counting rows. 
+    (This is handled the same as the column of counts above, since rows for 
+    the same combination get summed either way.)
+    - optionally, the name of a file in which to keep the counts, and whether 
+    to add the counts made from the data provided to those already kept 
+    there, so that only new data needs to be read each time.
+    - optionally, the number of processes to use for counting when more than
+    one file provided, with each file counted in its own process, or when a 
+    single large tab-separated or comma-separated file is provided, with the
+    file split into parts counted in their own processes if more than 1. 
+    Defaults to one per core for more than one file and to reading a single 
+    file whole.
+    - optionally, when the file is a SQLite database, the name of the table 
+    or a query to use. The database does the counting.
+    - optionally, the form of the dataframe, such as `tsv` or `csv`, to use 
+    instead of determining it from the file extension. Needed when the file 
+    is `-`, for reading from stdin.
+    - optionally, a directory in which to keep the counts made from the 
+    dataframe file(s) so that reruns on the same unchanged file(s) skip 
+    reading them, and the size in megabytes that directory can grow to before
+    the least recently used counts get removed.
+    - optionally, the number of the largest groups to keep, with the rest 
+    combined into one group labeled 'Other'.
+    - optionally, the smallest fraction of the total count a group needs to be
+    kept rather than combined as 'Other'.
+    - optionally, a number of rows to make the plot from a sample of that 
+    many rows, for a quick look at a large dataframe, and whether to use 
+    the `first` rows or a random sample from throughout, `reservoir`. The 
+    percentages in the labels are then estimates shown with a margin of 
+    error, based on the number of rows actually sampled, except for a 
+    long-form table of counts or weighted rows.
+    - optionally, the name of a column, such as region or month, to make a 
+    grid of plots with one for each value of that column, all counted in one
+    step and with the same colors for the same groups and subgroups. The 
+    dataframe is read in full for this, and the figure size is that of each
+    plot in the grid.
+    - optionally, a number of degrees a wedge needs to span to have its label
+    drawn, so the labels of slivers too thin to read are left off, and how 
+    many of the groups left unlabeled to list in a legend instead.
 
     Returns:
     A plot object, meant for when using in Jupyter or IPython. Not triggered 
@@ -375,8 +2489,58 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
             "contents of the dataframe as pickled, tab-separated text, or "
             "comma-separated text must be provided and the name of that file "
             "specified when calling the script.")
-        # use file extension to decide how to parse dataframe file.
-        df = extract_dataframe(df_file)
+    if counts_col and weight_col:
+        sys.stderr.write("\n**ERROR** Provide either a column of counts "
+            "(`--counts_col`, `counts_col`)\nor a column of weights "
+            "(`--weight_col`, `weight_col`), not both.\n**EXITING !!**.\n")
+        sys.exit(1)
+    if facet_col and (state_file or sample or sql_source):
+        sys.stderr.write("\n**ERROR** Facets (`--facet_col`, `facet_col`) "
+            "can't be combined with\n`--state_file`, `--sample`, or "
+            "`--sql_source`.\n**EXITING !!**.\n")
+        sys.exit(1)
+    # count each group and binary state combination, reading only the 
+    # columns needed from the file if no dataframe provided. (The file 
+    # extension is used to decide how to parse dataframe file.) Missing data
+    # is kept in the counts for now so it can be considered in the check of 
+    # the binary state column below.
+    if facet_col:
+        # count each facet, group, and subgroup combination in one step, and
+        # total those for the counts overall
+        columns = [facet_col, grouping_col, binary_state_col]
+        if counts_col or weight_col:
+            columns.append(counts_col or weight_col)
+        if df is None:
+            df = pd.concat([extract_dataframe(file_name, columns=columns, 
+                categorical=columns[:3] if categorical else False, 
+                file_format=file_format) for file_name in expand_file_names(
+                df_file)], ignore_index=True)
+        facet_counts = tally_facets(df, facet_col, grouping_col, 
+            binary_state_col, dropna=False, counts_col=counts_col or weight_col)
+        counts = facet_counts.groupby(
+            level=[1, 2], sort=False, dropna=False).sum()
+    else:
+        counts = tally_subgroups_from_input(grouping_col, binary_state_col, 
+            df_file=df_file, df=df, dropna=False, chunksize=chunksize, 
+            categorical=categorical, counts_col=counts_col or weight_col, 
+            processes=processes,
+            sql_source=sql_source, file_format=file_format, 
+            cache_dir=cache_dir, cache_size=cache_size, sample=sample, 
+            sample_method=sample_method)
+    # the number of rows counted when made from a sample, noted on the counts
+    sampled_rows = counts.attrs.get("sampled_rows")
+    # add to the counts kept between runs, or start them over, if a state file
+    # is specified
+    if state_file:
+        if sample:
+            sys.stderr.write("\n**ERROR** Counts made from a sample can't be "
+                "kept in a state\nfile. Leave off `--sample` (`sample`) to use "
+                "`--state_file` (`state_file`)."
+                "\n**EXITING !!**.\n")
+            sys.exit(1)
+        counts = update_count_state(state_file, counts, 
+            [grouping_col, binary_state_col, counts_col or weight_col], 
+            append=append, sources=df_file if df is None else None)
 
 
     # Check if state column to use is actually binary data. If it isn't, can
@@ -384,173 +2548,41 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
     # That is unless the setting not to deal with missing data has been set.
     # Added that state column result in one state because could all be one of 
     # the two possible states. 
-    if not 2 >= len(set(df[binary_state_col].tolist())) > 0:
-        # copy original dataframe for easy comparison.
-        orig_df = df.copy()
-        # try removing any NA, Nan, or none & report doing that.
-        df[binary_state_col].replace('None', np.nan, inplace=True) #If any `None`
-        # happen to be strings, convert them now before removing.
-        df.dropna(subset=[binary_state_col])
-        if len(df) < len(orig_df):
+    # (The states are only looked through until a third one turns up.)
+    state_values = counts.index.get_level_values(1)
+    states_found = profile_values(state_values, stop_after=2)[0]
+    if not 2 >= len(states_found) + state_values.hasnans > 0:
+        # try removing any NA, Nan, or none & report doing that. (Any `None`
+        # that happen to be strings get removed, too.)
+        missing = state_values.isna() | (state_values == 'None')
+        if missing.any():
             sys.stderr.write("WARNING: Rows with missing data in the state "
                 "column removed.")
             sys.stderr.write("\n{} rows were removed.".format(
-                len(orig_df) - len(df)))
+                counts[missing].sum()))
+            counts = counts[~missing]
+            states_found = profile_values(
+                counts.index.get_level_values(1), stop_after=2)[0]
             # if any removed, reflect that in assert message
-            if len(df) < len(orig_df):
-                assert 2 >= len(set(df[binary_state_col].tolist())) > 0, ("The "
-                    "column designated as representing binary data contains "
-                    "more than "
-                    "two states, even if 'missing' values are removed.")
-    assert 2 >= len(set(df[binary_state_col].tolist())) > 0, ("The column "
-        "designated as representing binary data contains more than two states.")
-
-    # Prepare derivatives of the dataframe that may be needed for delineating 
-    # the plotting data
-    tc = df[binary_state_col].value_counts()
-    if hilolist:
-        assert len(hilolist) == len(tc), "The list provided "
-        "to specify the intensity degree must include all subgroups. Subgroups "
-        "are: '{}'.format(list(tc.index))"
-        tc = tc.reindex(hilolist)
-    total_binary_names = tc.index.tolist()
-    total_binary_size = tc.tolist()
-    grouped = df.groupby(grouping_col)
-    # use `value_counts()` on each group to get the count and name of each state
-    list_o_subgroup_names_l = []
-    list_o_subgroup_size_l = []
-    for name,group in grouped:
-        dfc = group[binary_state_col].value_counts()
-        list_o_subgroup_names_l.append(dfc.index.tolist())
-        list_o_subgroup_size_l.append(dfc.tolist())
-    
-    # Delineate data for the plot:  (SEE TEST SETTINGS BELOW)
-    group_names= grouped.size().index.tolist()
-    group_size= grouped.size().tolist() #len of each groupby grouping
-    '''
-    list_o_subgroup_names_l=[group[binary_state_col].tolist(
-        ) for name, group in grouped]
-    # flatten that list of lists
-    subgroup_names=[i for sublt in list_o_subgroup_names_l for i in sublt]
-    '''
-    # flatten each list of lists made above to get the list needed
-    subgroup_names=[i for sublt in list_o_subgroup_names_l for i in sublt]
-    #assert len(subgroup_names) == 2 * len(grouped) <-- That would be true if
-    # all states represented by all subgroups, but that may not be the case
-    subgroup_size=[i for sublt in list_o_subgroup_size_l for i in sublt]
-    assert len(subgroup_size) == len(subgroup_names)
-
-    #FOR TESTING BASICS USE HARDCODED DATA based mostly on 
-    # https://python-graph-gallery.com/163-donut-plot-with-subgroups/:
-    '''
-    group_names= ["groupA","groupB","groupC"] 
-    group_size=[12,11,30] #len of each groupby grouping
-    subgroup_names=['A.1', 'A.2', 'B.1', 'B.2', 'C.1', 'C.2', ]
-    subgroup_size=[6,6,5.5,5.5,15,15]
-    '''
-
-    # Create colors generator
-    colormp = sequential_color_maps_generator() 
-    #a, b =[next(colormp)(0.6) for x in total_binary_names]
-    [next(colormp) for g in range(advance_color_increments)]#advance prior to 
-    # use, if initial skips specified
-
-    # Create a switch system for the labels
-    ip_it_grp_label = {
-        (True,True):["{} ({:.1%} [{}])".format(
-            x,y/len(df),y) for x, y in zip(group_names, group_size)],
-        (True,False):["{} ({:.1%})".format(
-            x,y/len(df)) for x, y in zip(group_names, group_size)],
-        (False,True):["{} [{}]".format(
-            x,y) for x, y in zip(group_names, group_size)],
-        (False,False):["{}".format(
-            x) for x, y in zip(group_names, group_size)]}
-
-    #Set up for plot.
-    fig=plt.figure(figsize=plot_figure_size) # based on 
-    # https://stackoverflow.com/a/55051471/8508004; `fig=plt.figure(
-    #figsize=(10, 7))` will result in much larger plot in the output cell but 
-    # if you assign the plot returned by the function to a variable, say `x`, 
-    # can use`x.figure.set_size_inches((17, 11))` to make large after the fact.
-    # See bottom of the following notebook about that:
-    # https://git.io/fjEji
-
-    #1 row 2 cols
-    ######first (and only) row, first col (LEFT subplot)
-    ax1 = plt.subplot2grid((1,2),(0,0))
-    ax1.axis('equal') #<- necessary? Commented out when trying to dial in 
-    #dimensions because worried it complicated things; however, once dialed in I
-    #ran it with it active and saw no difference. Inherited from original code 
-    # at Python Graph Gallery.
-    ### First Ring (outside) and only ring for first row, first col
-    ### THIS WILL BE TOTAL DATA FOR BINARY STATE
-    labels_with_total_each = ["{} ({:.1%} [{}])".format(x,
-        y/len(df),y) for x, y in zip(total_binary_names, total_binary_size)]
-    tcm = [next(colormp)(0.6) for x in total_binary_names]
-    if swap_left_colors:
-        tcm.reverse()
-    mypie, _ = plt.pie(
-        total_binary_size, radius=1.3, labels=labels_with_total_each , 
-        textprops={'fontsize': main_plot_text_size}, colors=tcm )
-    plt.setp( mypie, width=0.3, edgecolor='white')
-
-    plt.margins(0,0)
-    if include_subplot_titles:
-        plt.title(total_plot_title, size = title_text_size, y=1.08) # offset
-        # based on https://stackoverflow.com/a/23338363/8508004 and comments 
-        # below that
-
-
-
-
-    # following completion of left subplot, advance colors for right subplot if 
-    # `advance_right_color`/`advance_right_color_increments` specified
-    [next(colormp) for g in range(advance_right_color_increments)]
-
-
-    #####first (and only) row, second col (RIGHT subplot)
-    colorm_per_grp=[next(colormp) for g in group_names]
-    ax1 = plt.subplot2grid((1,2), (0, 1))
-    ax1.axis('equal') #<- necessary? Commented out when trying to dial in 
-    #dimensions because worried it complicated things; however, once dialed in I
-    #ran it with it active and saw no difference. Inherited from original code 
-    # at Python Graph Gallery.
-    ### First Ring (outside) for first row, second col
-    ### This will be size of each group
-    labels_with_grp_sz = ip_it_grp_label[(
-        include_percent_in_grp_label,include_total_in_grp_label)]
-    mypie, _ = plt.pie(
-        group_size, radius=1.3, labels=labels_with_grp_sz, 
-        textprops={'fontsize': main_plot_text_size},
-        colors=[colormp(0.63) for colormp in colorm_per_grp] )
-    plt.setp( mypie, width=0.3, edgecolor='white')
-
-    ### Second Ring (Inside) for first row, SECOND col
-    ### This will be the subgroup counting of the state for each group
-    # Note that the code blocked out just below this comment would work if at
-    # least one representative of each possible binary state existed for each
-    # group. However that won't be the case always as some groups might 
-    # represent one of the two states. (Plus this way didn't offer a way to
-    # control color.)
-    '''
-    list_sub_grp_colors_l=[[colormp(
-        0.6),colormp(0.2)] for colormp in colorm_per_grp]
-    # flatten that list
-    sub_grp_colors = [i for sublt in list_sub_grp_colors_l for i in sublt]
-    # note that the next line works but much easier to understand this complex 
-    # set of steps in last two lines of actual code to not do at once: 
-    #sub_grp_colors = [i for sublt in [[colormp(0.6),colormp(
-    #    0.2)] for colormp in colorm_per_grp] for i in sublt]
-    '''
-    # So the following color code deals with cases with just one state. Plus, 
-    # try to apply primary or secondary color depending on order it is in in the 
-    # states list.
-    list_sub_grp_colors_l  = []
-    states_represented = f7(df[binary_state_col].tolist())
-    #int_degree = [0.6,0.2]
-    if hilolist:
-        states_represented = hilolist
-    else:
+            assert 2 >= len(states_found) > 0, ("The "
+                "column designated as representing binary data contains "
+                "more than "
+                "two states, even if 'missing' values are removed.")
+    has_missing = counts.index.get_level_values(1).hasnans
+    assert 2 >= len(states_found) + has_missing > 0, ("The "
+        "column designated as representing binary data contains more than two "
+        "states.")
+    # now that check done, missing data is set aside like `groupby` would
+    counts = counts[counts.index.get_level_values(0).notna() & 
+        counts.index.get_level_values(1).notna()]
+    # combine the smaller groups as 'Other' if specified
+    counts = fold_into_other(
+        counts, top_n_groups=top_n_groups, min_group_share=min_share)
+
+    # Check the list to use as the high to low intensity degree for coloring 
+    # the states, if provided
+    states_represented = profile_values(counts.index.get_level_values(1))[0]
+    if not hilolist:
         # Provide feedback on what is being used as high to low intensity list 
         # so user can adjust; using `if __name__ == "__main__"` to customize 
         # note depending if script called from command line.
@@ -568,70 +2600,52 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
         else:
             sys.stderr.write("Provide a Python list as `hilolist` when calling "
                 "the function to specify the order.\n\n")
-    # assign intensity degree settings for each subgroup so consistent among 
-    # other groups
-    int_degree = np.linspace(0.6, 0.2, num=len(states_represented))
-    if not light_color_for_last_in_state_set:
-        int_degree.reverse()
-    # determine colors for each subgroup before `plt.pie` step
-    for idx,subgroups_l in enumerate(list_o_subgroup_names_l):
-        cm = colorm_per_grp[idx]
-        grp_colors = [cm(int_degree[states_represented.index(
-            sgrp)]) for sgrp in subgroups_l]
-        list_sub_grp_colors_l.append(grp_colors)
-    # flatten that list
-    sub_grp_colors = [i for sublt in list_sub_grp_colors_l for i in sublt]
-    mypie2, _ = plt.pie(
-        subgroup_size, radius=1.3-0.3, labels=subgroup_names, 
-        textprops={'fontsize': main_plot_text_size}, labeldistance=0.7, 
-        colors=sub_grp_colors)
-    plt.setp( mypie2, width=0.4, edgecolor='white')
-    plt.margins(0,0)
-    if include_subplot_titles:
-        plt.title(group_plot_title, size = title_text_size, y=1.08) # offset
-        # based on https://stackoverflow.com/a/23338363/8508004 and comments 
-        # below that
-
-    #FOR TESTING BASICS USE HARDCODED DATA based mostly on 
-    # https://python-graph-gallery.com/163-donut-plot-with-subgroups/ &
-    # https://stackoverflow.com/a/38438533/8508004  :
-    '''
-    # Create colors
-    colormp = sequential_color_maps_generator() 
-    a, b, c=[next(colormp) for g in group_names]
-
-    #1 row 2 cols
-    #first row, first col
-    ax1 = plt.subplot2grid((1,2),(0,0))
-    ax1.axis('equal')
-    # First Ring (outside) for first row, first col
-    mypie, _ = plt.pie(group_size, radius=1.3, labels=group_names, colors=[a(0.6), b(0.6), c(0.6)] )
-    plt.setp( mypie, width=0.3, edgecolor='white')
-
-    # Second Ring (Inside) for first row, first col
-    mypie2, _ = plt.pie(subgroup_size, radius=1.3-0.3, labels=subgroup_names, labeldistance=0.7, colors=[a(0.55), a(0.2), b(0.55), b(0.2), c(0.60), c(0.2)])
-    plt.setp( mypie2, width=0.4, edgecolor='white')
-    plt.margins(0,0)
-    plt.title('Nested plot 1')
-
-
-    #first row sec col
-    group_size=[40,22,13]
-    subgroup_size=[20,20,11,11,6.5,6.5]
-    a, b, c=[next(colormp ),next(colormp ),next(colormp )]
-    ax1 = plt.subplot2grid((1,2), (0, 1))
-    ax1.axis('equal')
-    # First Ring (outside) for first row, second col
-    mypie, _ = plt.pie(group_size, radius=1.3, labels=group_names, colors=[a(0.6), b(0.6), c(0.6)] )
-    plt.setp( mypie, width=0.3, edgecolor='white')
-
-    # Second Ring (Inside) for first row, second col
-    mypie2, _ = plt.pie(subgroup_size, radius=1.3-0.3, labels=subgroup_names, labeldistance=0.7, colors=[a(0.55), a(0.2), b(0.55), b(0.2), c(0.60), c(0.2)])
-    plt.setp( mypie2, width=0.4, edgecolor='white')
-    plt.margins(0,0)
-    plt.title('Nested plot 2')
-    '''
 
+    # Delineate data for the plot, including the labels and colors, as a spec
+    # that can then be drawn
+    # with a sample, the percentages are estimates with a margin of error 
+    # worked out from the number of rows sampled
+    sample_size = None
+    if sample:
+        # the rows actually sampled, though the rows of a table of counts 
+        # aren't a sample of what is counted, and weighted shares don't follow
+        # the binomial formula, and so those get no margin of error
+        sample_size = None if counts_col or weight_col else sampled_rows
+        sys.stderr.write("Note: The plot is made from a sample of the data "
+            "and the percentages are estimates.\n")
+    spec_settings = dict(hilolist=hilolist, 
+        include_percent_in_grp_label=include_percent_in_grp_label,
+        include_total_in_grp_label=include_total_in_grp_label,
+        light_color_for_last=light_color_for_last_in_state_set,
+        advance_color_increments=advance_color_increments,
+        advance_right_color_increments=advance_right_color_increments,
+        swap_left_colors=swap_left_colors, include_total_ring=True,
+        sample_size=sample_size, min_label_angle=min_label_angle, 
+        culled_legend_size=culled_legend_size)
+    if facet_col:
+        facet_names, specs = facet_donut_specs(
+            facet_counts, counts, **spec_settings)
+    else:
+        spec = compute_donut_spec(counts, **spec_settings)
+
+    #Set up for plot and draw it; the total for each state is on the left and
+    # the breakdown by group on the right. (If you assign the plot returned by 
+    # the function to a variable, say `x`, can use 
+    # `x.figure.set_size_inches((17, 11))` to make large after the fact. See 
+    # bottom of https://git.io/fjEji about that.)
+    if facet_col:
+        # a grid with the plot(s) of each facet
+        ax1 = render_facet_grid(specs, facet_names, plot_figure_size, 
+            main_plot_text_size, titles=[total_plot_title, 
+            group_plot_title] if include_subplot_titles else None, 
+            title_size=title_text_size, title_y=1.08)[0]
+    else:
+        ax1 = render_donut_spec(spec, plot_figure_size, main_plot_text_size, 
+            titles=[total_plot_title, group_plot_title] if (
+            include_subplot_titles) else None, title_size=title_text_size, 
+            title_y=1.08) # title offset based on 
+            # https://stackoverflow.com/a/23338363/8508004 and comments below 
+            # that
 
 
     # Reporting and Saving
@@ -659,6 +2673,95 @@ def donut_plot_with_total_binary_summary_and_binary_state_subgroups(
         sys.stderr.write("Plot figure object returned.")
         return ax1
 
+
+def donut_plots_in_batch(column_pairs, filters=None, df_file=None, df=None,
+    processes=None, file_format=None, name_prefix=None, **kwargs):
+    '''
+    Takes a list of pairs of column names, each a `grouping_col` and a 
+    `binary_state_col` as the main function of the script takes them, and 
+    optionally `filters`, a dictionary of names and queries selecting rows, 
+    such as `{"2019": "year == 2019"}` (see pandas `DataFrame.query()`), and 
+    makes a donut plot for every pair of columns with the rows of every 
+    filter, from one dataframe provided either directly or as a file.
+
+    Work is shared among the plots: the file is read once, with only the 
+    columns in the pairs unless there are filters; each column used is made 
+    categorical once; and the rows of each filter are selected once and then
+    counted for each pair. The plots are drawn and saved in a pool of 
+    `processes` processes, defaulting to one per core, that is started before
+    the counting, with matplotlib loaded in each (see `warm_up_renderer()`), 
+    and so plots get drawn while the rest are still being counted.
+
+    Any other keyword arguments, such as `hilolist` or `sort_on_subgroup_name`,
+    are used for every plot, see `compute_donut_spec()`; the sizes, titles, 
+    and colors otherwise follow the settings at the top of the script. Each 
+    image is named with `name_prefix`, defaulting to `save_plot_name_prefix`,
+    and the names of the columns and the filter, and the name of the filter 
+    is added to the title.
+
+    Returns a list of the names of the image files saved.
+    '''
+    import multiprocessing
+    filters = filters or {None: None}
+    columns = f7([col for pair in column_pairs for col in pair])
+    if df is None:
+        df = extract_dataframe(df_file, columns=None if any(
+            filters.values()) else columns, file_format=file_format)
+    # make each column used categorical once, for all the plots
+    categorical_df = pd.DataFrame(
+        {col: df[col].astype("category") for col in columns}, columns=columns)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, initializer=warm_up_renderer)
+    results = []
+    try:
+        for filter_name, query in filters.items():
+            rows = categorical_df
+            if query:
+                rows = categorical_df[df.eval(query).to_numpy(dtype=bool)]
+            for grouping_col, binary_state_col in column_pairs:
+                counts = tally_subgroups(rows, grouping_col, binary_state_col)
+                if counts.empty:
+                    sys.stderr.write("Note: No rows to plot for '{}' and "
+                        "'{}'{}; skipped.\n".format(
+                        grouping_col, binary_state_col, 
+                        "" if filter_name is None else 
+                        " with filter '{}'".format(filter_name)))
+                    continue
+                assert len(profile_values(counts.index.get_level_values(1), 
+                    stop_after=2)[0]) <= 2, ("The column '{}' designated as "
+                    "representing binary data contains more than two "
+                    "states.".format(binary_state_col))
+                spec = compute_donut_spec(counts, 
+                    light_color_for_last=light_color_for_last_in_state_set, 
+                    include_total_ring=True, **kwargs)
+                name_parts = [grouping_col, binary_state_col] + (
+                    [] if filter_name is None else [filter_name])
+                file_name = generate_output_file_name("_".join(
+                    [name_prefix or save_plot_name_prefix] + [str(part).replace(
+                    os.sep, "_") for part in name_parts]))
+                titles = [total_plot_title, group_plot_title] if (
+                    include_subplot_titles) else None
+                if titles and filter_name is not None:
+                    titles[-1] = "{} ({})".format(titles[-1], filter_name)
+                settings = (spec, file_name, plot_figure_size, 
+                    main_plot_text_size, titles, title_text_size, 1.08)
+                if pool:
+                    results.append(pool.apply_async(
+                        save_donut_figure, settings))
+                else:
+                    results.append(save_donut_figure(*settings))
+        file_names = [result.get() for result in results] if pool else results
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    sys.stderr.write("\n{} plot images saved.\n".format(len(file_names)))
+    return file_names
+
+
 ###--------------------------END OF MAIN FUNCTION----------------------------###
 ###--------------------------END OF MAIN FUNCTION----------------------------###
 
@@ -687,6 +2790,24 @@ def main():
     kwargs['swap_left_colors'] = args.swap_left_colors
     kwargs['advance_color_increments'] = advance_color_increments
     kwargs['advance_right_color_increments'] = advance_right_color_increments
+    kwargs['chunksize'] = args.chunksize
+    kwargs['categorical'] = args.categorical
+    kwargs['counts_col'] = args.counts_col
+    kwargs['weight_col'] = args.weight_col
+    kwargs['state_file'] = args.state_file
+    kwargs['append'] = args.append
+    kwargs['processes'] = args.processes
+    kwargs['sql_source'] = args.sql_source
+    kwargs['file_format'] = args.file_format
+    kwargs['cache_dir'] = args.cache_dir
+    kwargs['cache_size'] = args.cache_size
+    kwargs['top_n_groups'] = args.top_n_groups
+    kwargs['min_share'] = args.min_share
+    kwargs['sample'] = args.sample
+    kwargs['sample_method'] = args.sample_method
+    kwargs['facet_col'] = args.facet_col
+    kwargs['min_label_angle'] = args.min_label_angle
+    kwargs['culled_legend_size'] = args.culled_legend_size
     donut_plot_with_total_binary_summary_and_binary_state_subgroups(
         df_file=args.df_file,binary_state_col=args.binary_state_col,
         grouping_col=args.grouping_col,**kwargs)
@@ -715,11 +2836,19 @@ if __name__ == "__main__":
         (fomightez @ github) ***")
 
     parser.add_argument("df_file", help="Name of file containing the \
-        dataframe. Whether it is in the form of a pickled dataframe, \
-        tab-separated text, or comma-separated text needs to be indicated by \
-        the file extension. So `.pkl`, `.tsv`, or `.csv` for the file \
-        extension. \
-        ", metavar="DF_FILE")
+        dataframe. More than one file, such as shards of one export, can be \
+        listed, or matched by a quoted glob pattern like `'part-*.tsv'`, and \
+        those will be counted in parallel and combined. Whether it is in the \
+        form of a pickled dataframe, \
+        tab-separated text, comma-separated text, Parquet, or Feather / Arrow \
+        IPC needs to be indicated by the file extension. So `.pkl`, `.tsv`, \
+        `.csv`, `.parquet`, or `.feather` for the file extension. Pickled or \
+        text forms can be compressed, indicated by adding `.gz`, `.bz2`, \
+        `.xz`, `.zst`, or `.zip` after the extension, such as `data.tsv.gz`. \
+        A SQLite database (`.db`, `.sqlite`, or `.sqlite3`) can also be used \
+        along with the `--sql_source` option. Use `-` to read from stdin \
+        along with the `--format` option. \
+        ", nargs='+', metavar="DF_FILE")
 
     parser.add_argument("binary_state_col", help="Text indicating column in \
         dataframe with the binary data. This data is to be plotted in inner \
@@ -800,6 +2929,102 @@ if __name__ == "__main__":
         the number to advance after the flag on the command line. For example, \
         `-arc 4`. If that doesn't allow dialing in a good set of colors, and \
         you know Python, you can edit the `list_of_other_good_sequences`.")
+    parser.add_argument('-cs', '--chunksize', action='store', type=int, 
+        help="Use this option for large files, such as tab-separated text, \
+        to have the binary states and groups counted as the file is \
+        read in chunks of the specified number of rows, for example \
+        `-cs 1000000`. Only the binary state and grouping columns get read and \
+        the full dataframe is never held in memory.")
+    parser.add_argument("-cat", "--categorical",help=
+        "add this flag to have the binary state and grouping columns parsed \
+        straight to categoricals as the file is read. This greatly reduces \
+        memory use and speeds counting for large files with many rows.",
+        action="store_true")
+    parser.add_argument('-cc', '--counts_col', action='store', type=str, 
+        help="Use this option when the input is already a long-form table of \
+        counts, with one row per group and binary state combination, to \
+        supply the name of the column with the counts. For example `-cc n`. \
+        The counts will be used directly instead of counting rows.")
+    parser.add_argument('-w', '--weight_col', action='store', type=str, 
+        help="Use this option to supply the name of a column with a weight or \
+        value for each row, such as a count or a size in bytes. The ring \
+        sizes and the totals and percents in the labels will then be sums of \
+        that column instead of numbers of rows. Can't be combined with \
+        `--counts_col`.")
+    parser.add_argument('-sf', '--state_file', action='store', type=str, 
+        help="Use this to provide a file in which to keep the counts made \
+        from the data, so that later data can be added to them with the \
+        `--append` option. For example, `-sf counts_state.pkl`.")
+    parser.add_argument('-a', '--append', action='store_true', help="Use this \
+        along with `--state_file` to add the counts made from DF_FILE to those \
+        kept in the state file and plot the combined counts, such as when new \
+        data arrives every hour. Only the new data gets read. The state file \
+        gets updated with the combined counts. The same file cannot be added \
+        twice.")
+    parser.add_argument('-p', '--processes', action='store', type=int, 
+        help="The number of processes to use for counting when more than one \
+        file is provided as input, for example `-p 8`. Each file gets counted \
+        in its own process. A single large uncompressed tab-separated or \
+        comma-separated file is instead split into parts at line breaks, \
+        each counted in its own process, if more than 1 is specified; only do \
+        that if no values contain line breaks within quotes. Defaults to one \
+        per core for more than one file.")
+    parser.add_argument('-sql', '--sql_source', action='store', type=str, 
+        help="When the input is a SQLite database (`.db`, `.sqlite`, or \
+        `.sqlite3`), use this to provide the name of the table, or a query \
+        starting with `SELECT`, to use. For example `-sql events`. The \
+        database does the counting and only the counts are read.")
+    parser.add_argument('-fmt', '--format', action='store', type=str, 
+        dest='file_format', help="Use this to indicate the form of the \
+        dataframe, such as `tsv` or `csv`, instead of it being determined by \
+        the file extension. This is required when `-` is used as DF_FILE to \
+        read tab-separated or comma-separated text from stdin, for example at \
+        the end of a pipeline: `zcat data.tsv.gz | awk ... | python \
+        script.py - GROUPS SUBGROUPS --format tsv`. (`--format tsv.gz` works \
+        for compressed text.) Stdin is always read in chunks.")
+    parser.add_argument('-cd', '--cache_dir', action='store', type=str, 
+        help="Use this to provide a directory in which to keep the counts \
+        made from the dataframe file(s). Later runs on the same unchanged \
+        file(s) with the same columns then use the kept counts and skip \
+        reading the data, which helps when only adjusting the look of the \
+        plot with options such as `--advance_color`.")
+    parser.add_argument('-csz', '--cache_size', action='store', type=int, 
+        default=1024, help="**FOR ADVANCED USE.** Use this to set the size, \
+        in megabytes, the directory set with `--cache_dir` can grow to before \
+        the least recently used counts get removed. Default is 1024.")
+    parser.add_argument('-tg', '--top_n_groups', action='store', type=int, 
+        help="Use this to keep only the specified number of the largest \
+        groups, with the rest combined into one group labeled 'Other'.")
+    parser.add_argument('-ms', '--min_share', action='store', type=float, 
+        help="Use this to keep only the groups that each make \
+        up at least the specified fraction of the total, such as `0.01` for \
+        1%%, with the rest combined as 'Other'.")
+    parser.add_argument('-smp', '--sample', action='store', type=int, 
+        help="Use this to make a quick preview of a large dataframe from a \
+        sample of the specified number of rows, for example `-smp 100000`. \
+        The percentages in the labels are then estimates and include a \
+        margin of error (the half-width of a 95%% confidence interval), \
+        except with `--counts_col` or `--weight_col`, where they are shown \
+        without one.")
+    parser.add_argument('-sm', '--sample_method', action='store', type=str, 
+        choices=['first', 'reservoir'], default='first', help="Use this \
+        along with `--sample` to choose how the rows are sampled: `first` \
+        reads only the first rows of the dataframe and `reservoir` picks a \
+        random sample from throughout it. Defaults to `first`.")
+    parser.add_argument('-fc', '--facet_col', action='store', type=str, 
+        help="Use this to provide the name of a column, such as region or \
+        month, to make a grid of plots, one for each value of that column, \
+        for example `-fc region`. The counts for all of them are made in one \
+        step and the same group or subgroup gets the same colors in each.")
+    parser.add_argument('-mla', '--min_label_angle', action='store', 
+        type=float, help="Use this to leave off the labels of wedges \
+        spanning less than the specified number of degrees, for example \
+        `-mla 3`, which are too thin to read and slow down saving the plot \
+        when there are many.")
+    parser.add_argument('-cls', '--culled_legend_size', action='store', 
+        type=int, default=0, help="Use this along with `--min_label_angle` to \
+        list up to the specified number of the groups left unlabeled, the \
+        largest first, in a legend below the plot instead.")
 
 
 
@@ -810,7 +3035,9 @@ if __name__ == "__main__":
     if len(sys.argv)==1:    #from http://stackoverflow.com/questions/4042452/display-help-message-with-python-argparse-when-script-is-called-without-any-argu
         parser.print_help()
         sys.exit(1)
-    args = parser.parse_args()
+    # intermixed parsing so options can come between listed files and the 
+    # column names (not available in older Pythons)
+    args = getattr(parser, "parse_intermixed_args", parser.parse_args)()
     save_vg = args.save_vg
     include_percent_in_grp_label= not args.leave_off_percent_in_group
     include_total_in_grp_label= not args.leave_off_total_in_group